@@ -0,0 +1,82 @@
+"""
+Memory used per track by the play list, as a plain list of MediaItem objects
+and as the column-backed PlayListSnapshot.
+
+    python benchmarks/playlist_memory.py [track counts...]
+"""
+import gc
+import sys
+import tracemalloc
+from pathlib import Path
+from random import Random
+
+sys.path.insert(0, str(Path(__file__).resolve().parent.parent / "src"))
+
+from modules.types_ import MediaInfo, MediaItem, CoverRef, SearchKeys  # noqa: E402
+from modules.playlist import PlayListSnapshot  # noqa: E402
+from modules.searchkeys import SEARCH_KEY_SEPARATOR, getSearchKeys  # noqa: E402
+
+def getPrefixKeys(prefix: str) -> tuple[str, str, str]:
+    """Normalized, pinyin and initials of a field prefix, a number appended to it reads the same in all three"""
+    keys = getSearchKeys(prefix, "", "")
+    normalized = keys.normalized.split(SEARCH_KEY_SEPARATOR)[0]
+    if keys.pinyin is None or keys.initials is None:
+        return normalized, normalized, normalized
+    return normalized, keys.pinyin.split(SEARCH_KEY_SEPARATOR)[0], keys.initials.split(SEARCH_KEY_SEPARATOR)[0]
+
+def getFieldSearchKeys(fields: list[tuple[str, int]], prefixKeys: dict[str, tuple[str, str, str]]) -> SearchKeys:
+    """What the scanner would store for `prefix + number` fields, running pypinyin once per prefix"""
+    fieldKeys = [[key + str(number) for key in prefixKeys[prefix]] for prefix, number in fields]
+    normalized, pinyin, initials = (SEARCH_KEY_SEPARATOR.join(keys) for keys in zip(*fieldKeys))
+    if normalized == pinyin == initials:
+        return SearchKeys(normalized, None, None)
+    return SearchKeys(normalized, pinyin, initials)
+
+def generateItems(count: int, seed: int = 139) -> list[MediaItem]:
+    """A library with a realistic amount of repetition: ~12 tracks per album, ~4 albums per artist"""
+    random = Random(seed)
+    prefixKeys = {prefix: getPrefixKeys(prefix) for prefix in ("Artist ", "歌手 ", "Album ", "专辑 ", "Track title ", "歌曲标题 ")}
+    artistCount = max(1, count // 48)
+    items: list[MediaItem] = []
+    for i in range(count):
+        albumId = i // 12
+        artistId = albumId // 4 % artistCount
+        artistPrefix = "Artist " if artistId % 3 else "歌手 "
+        albumPrefix = "Album " if albumId % 2 else "专辑 "
+        titlePrefix = "Track title " if i % 3 else "歌曲标题 "
+        artist, album, title = f"{artistPrefix}{artistId}", f"{albumPrefix}{albumId}", f"{titlePrefix}{i}"
+        mediaPath = Path(f"D:/CloudMusic/{artist}/{album}/{i % 12 + 1:02d} - {title}.flac")
+        # artists and albums are decoded from every file, equal strings are separate objects
+        info = MediaInfo(title, "".join(list(artist)), "".join(list(album)),
+                         random.randint(120_000, 420_000),
+                         CoverRef(mediaPath, random.randint(100, 5000), random.randint(20_000, 900_000), "image/jpeg")
+                         if i % 10 else None,
+                         Path(f"G:/lrc/{title}.lrc") if i % 2 else None,
+                         # as the scanner stores them, computed per prefix since pypinyin would dominate the run
+                         getFieldSearchKeys([(titlePrefix, i), (artistPrefix, artistId), (albumPrefix, albumId)], 
+                                            prefixKeys))
+        items.append(MediaItem(mediaPath, info))
+    return items
+
+def measure(build, count: int) -> float:
+    gc.collect()
+    tracemalloc.start()
+    result = build()
+    currentBytes, _ = tracemalloc.get_traced_memory()
+    tracemalloc.stop()
+    del result
+    return currentBytes / count
+
+def main():
+    counts = [int(argument) for argument in sys.argv[1:]] or [100_000, 1_000_000]
+    print(f"{'tracks':>10} {'list[MediaItem]':>18} {'PlayListSnapshot':>18}")
+    for count in counts:
+        listBytes = measure(lambda: generateItems(count), count)
+        items = generateItems(count)
+        # the snapshot keeps nothing of the items it was built from
+        snapshotBytes = measure(lambda: PlayListSnapshot().appended(items), count)
+        del items
+        print(f"{count:>10} {listBytes:>14.0f} B/t {snapshotBytes:>14.0f} B/t")
+
+if __name__ == "__main__":
+    main()
@@ -1,82 +1,110 @@
 # init application and load font before everything
 import sys
+import locale
+import multiprocessing
 
-from PySide6.QtWidgets import QApplication
-from PySide6.QtGui import QFontDatabase, QFont
+# workers of the process scan backend re-import this file, they must not start the UI
+if __name__ == "__main__":
+    multiprocessing.freeze_support()
+    # the play list is sorted by the user's collation
+    try:
+        locale.setlocale(locale.LC_COLLATE, "")
+    except locale.Error:
+        # the environment names a locale that isn't installed, code point order is still usable
+        locale.setlocale(locale.LC_COLLATE, "C")
 
-app = QApplication(sys.argv)
-QFontDatabase.addApplicationFont("res/fonts/HarmonyOS_Sans_SC_Regular.ttf")
-app.setFont(QFont("HarmonyOS Sans SC"))
+    from PySide6.QtWidgets import QApplication
+    from PySide6.QtGui import QFontDatabase, QFont
 
-# main
-from pathlib import Path
+    app = QApplication(sys.argv)
+    QFontDatabase.addApplicationFont("res/fonts/HarmonyOS_Sans_SC_Regular.ttf")
+    app.setFont(QFont("HarmonyOS Sans SC"))
 
-from PySide6.QtMultimedia import QMediaDevices
-from PySide6.QtWidgets import QTableWidgetItem
-from PySide6.QtCore import QTimer
-from qtawesome import icon as qtawesomeIcon
+    # main
+    from pathlib import Path
 
-from modules.ui.windows import MainWindow
-from modules.player import Player
-from modules.types_ import PlayStatus, PlayerStatus
-from modules.utils import humanizeDuration
+    from PySide6.QtMultimedia import QMediaDevices
+    from PySide6.QtCore import QTimer, QModelIndex
+    from qtawesome import icon as qtawesomeIcon
 
-player = Player(QMediaDevices.defaultAudioOutput())
-window = MainWindow()
-sliderPressed = False
+    from modules.ui.windows import MainWindow
+    from modules.player import Player
+    from modules.types_ import PlayStatus
+    from modules.utils import humanizeDuration
 
-def togglePause():
-    if player.getPlayerStatus() != PlayerStatus.READY: return
-    if player.getCurrentPlayStatus() == PlayStatus.STOPPED: return
+    player = Player(QMediaDevices.defaultAudioOutput())
+    window = MainWindow()
+    sliderPressed = False
+
+    def togglePause():
+        if player.getCurrentPlayStatus() == PlayStatus.STOPPED: return
     
-    if player.getCurrentPlayStatus() == PlayStatus.PAUSED:
-        player.unpause()
-        window.playStateBar.playPauseButton.setIcon(qtawesomeIcon("fa6.circle-pause", color="#c3ccdf"))
-        window.playStateBar.playPauseButton.update()
-    else:
-        player.pause()
-        window.playStateBar.playPauseButton.setIcon(qtawesomeIcon("fa6.circle-play", color="#c3ccdf"))
-        window.playStateBar.playPauseButton.update()
+        if player.getCurrentPlayStatus() == PlayStatus.PAUSED:
+            player.unpause()
+            window.playStateBar.playPauseButton.setIcon(qtawesomeIcon("fa6.circle-pause", color="#c3ccdf"))
+            window.playStateBar.playPauseButton.update()
+        else:
+            player.pause()
+            window.playStateBar.playPauseButton.setIcon(qtawesomeIcon("fa6.circle-play", color="#c3ccdf"))
+            window.playStateBar.playPauseButton.update()
         
-def onSliderPressed():
-    global sliderPressed
-    sliderPressed = True
+    def onSliderPressed():
+        global sliderPressed
+        sliderPressed = True
     
-def onSliderReleased():
-    global sliderPressed
-    sliderPressed = False
-    player.setPositionMs(int(player.getLengthMs() * (window.playStateBar.musicPlayProgress.value() / 1000)))
+    def onSliderReleased():
+        global sliderPressed
+        sliderPressed = False
+        player.setPositionMs(int(player.getLengthMs() * (window.playStateBar.musicPlayProgress.value() / 1000)))
+    
+    def play(index: QModelIndex):
+        generation = window.playListPage.playListModel.getGeneration()
+        # the view lags behind the player while queued play list changes are delivered
+        if not player.isCurrentGeneration(generation): return
+        # the view may be filtered by a search
+        if player.play(window.playListPage.playListModel.getPlayListRow(index.row()), generation):
+            window.updateMediaInfo(player.getCurrentSongInfo())
     
-def play(item: QTableWidgetItem):
-    player.play(item.row())
-    window.updateMediaInfo(player.getCurrentSongInfo())
+    def resyncPlayList():
+        if player.resyncPlayList():
+            window.onPlayListSyncStarted()
     
-def updateSliderProgress():
-    if player.getPlayerStatus() == PlayerStatus.READY and player.getCurrentPlayStatus() == PlayStatus.PLAYING:
-        try: 
-            if not sliderPressed:
-                window.playStateBar.musicPlayProgress.setValue(int(player.getPositionMs() / player.getLengthMs() * 1000))
-        except ZeroDivisionError: pass
-        window.playStateBar.musicTimePlayed.setText(humanizeDuration(player.getPositionMs()))
+    def updateSliderProgress():
+        if player.getCurrentPlayStatus() == PlayStatus.PLAYING:
+            try: 
+                if not sliderPressed:
+                    window.playStateBar.musicPlayProgress.setValue(int(player.getPositionMs() / player.getLengthMs() * 1000))
+            except ZeroDivisionError: pass
+            window.playStateBar.musicTimePlayed.setText(humanizeDuration(player.getPositionMs()))
 
-# connect signals
-player.playerReady.connect(window.onPlayerReady)
-player.onNextSong.connect(window.updateMediaInfo)
-player.onPreviousSong.connect(window.updateMediaInfo)
-window.playStateBar.playPauseButton.clicked.connect(togglePause)
-window.playStateBar.nextButton.clicked.connect(player.next)
-window.playStateBar.previousButton.clicked.connect(player.previous)
-window.playStateBar.musicPlayProgress.sliderPressed.connect(onSliderPressed)
-window.playStateBar.musicPlayProgress.sliderReleased.connect(onSliderReleased)
-window.playListPage.playList.itemDoubleClicked.connect(play)
+    # connect signals
+    player.playerReady.connect(window.onPlayerReady)
+    player.playListBatch.connect(window.appendPlayListItems)
+    player.scanProgress.connect(window.onScanProgress)
+    player.scanCancelled.connect(window.onScanCancelled)
+    player.scanFailed.connect(window.onScanFailed)
+    player.playListRowsChanged.connect(window.updatePlayListItems)
+    player.playListRowsRemoved.connect(window.removePlayListItems)
+    player.onNextSong.connect(window.updateMediaInfo)
+    player.onPreviousSong.connect(window.updateMediaInfo)
+    player.upcomingSongChanged.connect(window.preloadMediaInfo)
+    window.playStateBar.playPauseButton.clicked.connect(togglePause)
+    window.playStateBar.nextButton.clicked.connect(player.next)
+    window.playStateBar.previousButton.clicked.connect(player.previous)
+    window.playStateBar.musicPlayProgress.sliderPressed.connect(onSliderPressed)
+    window.playStateBar.musicPlayProgress.sliderReleased.connect(onSliderReleased)
+    window.playListPage.playList.doubleClicked.connect(play)
+    window.playListPage.syncButton.clicked.connect(resyncPlayList)
+    window.musicDetailPage.lyricDisplayer.setGetTimeFunc(player.getPositionMs)
 
-# update slider's progress from time to time
-updateTimer = QTimer()
-updateTimer.setInterval(500)
-updateTimer.timeout.connect(updateSliderProgress)
-updateTimer.start()
+    # update slider's progress from time to time
+    updateTimer = QTimer()
+    updateTimer.setInterval(500)
+    updateTimer.timeout.connect(updateSliderProgress)
+    updateTimer.start()
 
-# test player
-player.updatePlayList(Path("D:\\CloudMusic"), Path("G:\\lrc"), Path("cache"))
-window.show()
-app.exec()
\ No newline at end of file
+    # test player
+    player.setLibraryWatching(True)
+    player.updatePlayList([Path("D:\\CloudMusic")], Path("G:\\lrc"), Path("cache"))
+    window.show()
+    app.exec()
\ No newline at end of file
@@ -0,0 +1,87 @@
+import os
+from hashlib import blake2b
+from pathlib import Path
+
+# well known image types, anything else is stored without a suffix
+IMAGE_SUFFIXES = {
+    "image/jpeg": ".jpg",
+    "image/jpg": ".jpg",
+    "image/png": ".png",
+    "image/webp": ".webp",
+    "image/gif": ".gif",
+    "image/bmp": ".bmp",
+}
+
+class CoverCache(object):
+    """
+    Content addressed store for cover images.
+
+    A cover is stored once as `<root>/<first 2 hex digits>/<hash><suffix>` no
+    matter how many tracks embed it, storing bytes that are already present only
+    refreshes the file's mtime. The mtime is used as the LRU clock when the cache
+    grows over `maxBytes`.
+
+    Only holds plain attributes so that it can be passed to process workers.
+    """
+    def __init__(self, root: Path, maxBytes: int = 512 * 1024 * 1024) -> None:
+        self.root = root
+        self.maxBytes = maxBytes
+
+    def getPath(self, digest: str, suffix: str = "") -> Path:
+        return self.root / digest[:2] / (digest + suffix)
+
+    def store(self, data: bytes, mimeType: str = "") -> Path:
+        digest = blake2b(data, digest_size=20).hexdigest()
+        path = self.getPath(digest, IMAGE_SUFFIXES.get(mimeType.lower(), ""))
+        try:
+            # already cached, mark as recently used
+            os.utime(path)
+            return path
+        except FileNotFoundError:
+            pass
+
+        path.parent.mkdir(parents=True, exist_ok=True)
+        # several workers may store the same cover at once, write aside and rename
+        tempPath = path.with_name(f"{path.name}.{os.getpid()}.{id(data)}.tmp")
+        with open(tempPath, "wb") as file:
+            file.write(data)
+        os.replace(tempPath, path)
+        return path
+
+    def enforceLimit(self) -> list[Path]:
+        """Deletes the least recently used covers until the cache fits `maxBytes`, returns deleted paths"""
+        entries: list[tuple[float, int, Path]] = []
+        totalBytes = 0
+        evicted: list[Path] = []
+
+        if not self.root.is_dir():
+            return evicted
+
+        for shard in os.scandir(self.root):
+            if not shard.is_dir(follow_symlinks=False):
+                # left from the old one-file-per-track layout
+                if shard.is_file(follow_symlinks=False):
+                    os.remove(shard.path)
+                continue
+            for entry in os.scandir(shard.path):
+                if not entry.is_file(follow_symlinks=False):
+                    continue
+                stat = entry.stat(follow_symlinks=False)
+                entries.append((stat.st_mtime, stat.st_size, Path(entry.path)))
+                totalBytes += stat.st_size
+
+        if totalBytes <= self.maxBytes:
+            return evicted
+
+        entries.sort(key=lambda entry: entry[0])
+        for _, size, path in entries:
+            if totalBytes <= self.maxBytes:
+                break
+            try:
+                path.unlink()
+            except FileNotFoundError:
+                pass
+            totalBytes -= size
+            evicted.append(path)
+
+        return evicted
@@ -0,0 +1,254 @@
+import os
+import sqlite3
+from fnmatch import fnmatch
+from pathlib import Path
+from dataclasses import dataclass
+from typing import Container, Iterable, Iterator
+
+from .types_ import MediaInfo, MediaItem, CoverRef, SearchKeys, LyricsRef, SUPPORTED_AUDIO_FORMATS
+from .searchkeys import getSearchKeys
+
+@dataclass
+class IndexRecord:
+    """A track stored in the library index, `mediaInfo.lyricsPath` is always None"""
+    size: int
+    mtimeNs: int
+    mediaInfo: MediaInfo
+
+def walkLibrary(roots: Iterable[Path], 
+                excludes: Iterable[str] = (), 
+                followSymlinks: bool = True,
+                skipDirs: Container[str] = (),
+                libraryRoots: Iterable[Path] | None = None,
+                walkedDirs: list[str] | None = None) -> Iterator[os.DirEntry]:
+    """
+    Yields the supported audio files under `roots`, sorted by name in each directory.
+
+    `excludes` are glob patterns matched against both the name of a file or
+    directory and its path relative to the library root (with `/` separators),
+    a matching directory is skipped with everything under it. `libraryRoots`
+    are the roots relative paths are computed from when `roots` are directories
+    inside the library, they default to `roots`. Sub directories in `skipDirs`
+    aren't entered. Directories are identified by device and inode, so symlink
+    loops and roots nested in each other are only walked once. Every walked
+    directory is appended to `walkedDirs` if given.
+    The DirEntry objects cache their type and stat info, so the caller doesn't
+    need to stat the files again.
+    """
+    excludes = list(excludes)
+    libraryRoots = list(libraryRoots) if libraryRoots is not None else None
+    visitedDirs: set[tuple[int, int]] = set()
+
+    def isExcluded(name: str, relativePath: str) -> bool:
+        return any(fnmatch(name, pattern) or fnmatch(relativePath, pattern) for pattern in excludes)
+
+    def getRelativeDir(root: Path) -> str:
+        for libraryRoot in libraryRoots or ():
+            if root.is_relative_to(libraryRoot):
+                relativeDir = root.relative_to(libraryRoot).as_posix()
+                return "" if relativeDir == "." else relativeDir
+        return ""
+
+    for root in roots:
+        try:
+            rootStat = root.stat()
+        except OSError:
+            continue
+        if (rootStat.st_dev, rootStat.st_ino) in visitedDirs:
+            continue
+        visitedDirs.add((rootStat.st_dev, rootStat.st_ino))
+
+        # (directory, path relative to the library root), depth first
+        stack: list[tuple[str, str]] = [(str(root), getRelativeDir(root))]
+        while stack:
+            directory, relativeDir = stack.pop()
+            try:
+                with os.scandir(directory) as iterator:
+                    entries = sorted(iterator, key=lambda entry: entry.name)
+            except OSError:
+                continue
+            if walkedDirs is not None:
+                walkedDirs.append(directory)
+
+            subDirs: list[tuple[str, str]] = []
+            for entry in entries:
+                relativePath = f"{relativeDir}/{entry.name}" if relativeDir else entry.name
+                try:
+                    if entry.is_dir(follow_symlinks=followSymlinks):
+                        if entry.path in skipDirs or isExcluded(entry.name, relativePath):
+                            continue
+                        dirStat = entry.stat(follow_symlinks=followSymlinks)
+                        if (dirStat.st_dev, dirStat.st_ino) in visitedDirs:
+                            continue
+                        visitedDirs.add((dirStat.st_dev, dirStat.st_ino))
+                        subDirs.append((entry.path, relativePath))
+                    elif entry.name.lower().endswith(SUPPORTED_AUDIO_FORMATS) and \
+                         entry.is_file(follow_symlinks=followSymlinks) and \
+                         not isExcluded(entry.name, relativePath):
+                        yield entry
+                except OSError:
+                    continue
+
+            # reversed, so that the first sub dir is popped first
+            stack.extend(reversed(subDirs))
+
+class LibraryIndex(object):
+    """
+    On-disk index of parsed tracks, stored as a SQLite database in the cache dir.
+
+    A track is keyed by its absolute path and is considered unchanged as long as
+    its size and mtime match the stored ones, so rescans only need to parse new
+    or modified files.
+    """
+    # bump this when the table layout changes, the old index will be dropped
+    SCHEMA_VERSION = 5
+
+    def __init__(self, dbPath: Path) -> None:
+        dbPath.parent.mkdir(parents=True, exist_ok=True)
+        self._connection = sqlite3.connect(dbPath)
+        self._setupSchema()
+
+    def __enter__(self) -> "LibraryIndex":
+        return self
+
+    def __exit__(self, *args) -> None:
+        self.close()
+
+    def _setupSchema(self) -> None:
+        version: int = self._connection.execute("PRAGMA user_version").fetchone()[0]
+        if version != self.SCHEMA_VERSION:
+            self._connection.execute("DROP TABLE IF EXISTS tracks")
+        self._connection.execute("""
+            CREATE TABLE IF NOT EXISTS tracks (
+                path TEXT PRIMARY KEY,
+                size INTEGER NOT NULL,
+                mtimeNs INTEGER NOT NULL,
+                title TEXT NOT NULL,
+                artist TEXT NOT NULL,
+                album TEXT NOT NULL,
+                lengthMs INTEGER NOT NULL,
+                coverSource TEXT,
+                coverOffset INTEGER,
+                coverLength INTEGER,
+                coverMimeType TEXT,
+                normalizedKey TEXT NOT NULL,
+                pinyinKey TEXT,
+                initialsKey TEXT,
+                embeddedLyricsTag TEXT
+            )""")
+        self._connection.execute("CREATE INDEX IF NOT EXISTS tracksCoverSource ON tracks (coverSource)")
+        self._connection.execute(f"PRAGMA user_version = {self.SCHEMA_VERSION}")
+        self._connection.commit()
+
+    def loadAll(self) -> dict[str, IndexRecord]:
+        records: dict[str, IndexRecord] = {}
+        cursor = self._connection.execute(
+            "SELECT path, size, mtimeNs, title, artist, album, lengthMs, "
+            "coverSource, coverOffset, coverLength, coverMimeType, "
+            "normalizedKey, pinyinKey, initialsKey, embeddedLyricsTag FROM tracks")
+        for (path, size, mtimeNs, title, artist, album, lengthMs, 
+             coverSource, coverOffset, coverLength, coverMimeType,
+             normalizedKey, pinyinKey, initialsKey, embeddedLyricsTag) in cursor:
+            cover = CoverRef(Path(coverSource), coverOffset, coverLength, coverMimeType) if coverSource else None
+            info = MediaInfo(title, artist, album, lengthMs, cover, None, 
+                             SearchKeys(normalizedKey, pinyinKey, initialsKey),
+                             LyricsRef(Path(path), embeddedLyricsTag) if embeddedLyricsTag else None)
+            records[path] = IndexRecord(size, mtimeNs, info)
+        return records
+
+    def upsert(self, mediaItem: MediaItem, size: int, mtimeNs: int) -> None:
+        info = mediaItem.mediaInfo
+        cover = info.cover
+        searchKeys = info.searchKeys or getSearchKeys(info.title, info.artist, info.album)
+        self._connection.execute(
+            "INSERT OR REPLACE INTO tracks VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?)",
+            (str(mediaItem.mediaPath), size, mtimeNs, info.title, info.artist, info.album, info.lengthMs,
+             str(cover.sourcePath) if cover else None, cover.offset if cover else None,
+             cover.length if cover else None, cover.mimeType if cover else None,
+             searchKeys.normalized, searchKeys.pinyin, searchKeys.initials,
+             info.embeddedLyrics.tag if info.embeddedLyrics else None))
+
+    def remove(self, paths: Iterable[str]) -> None:
+        self._connection.executemany("DELETE FROM tracks WHERE path = ?", ((path,) for path in paths))
+
+    def removeByCoverPaths(self, coverPaths: Iterable[Path]) -> None:
+        self._connection.executemany("DELETE FROM tracks WHERE coverSource = ?", 
+                                     ((str(path),) for path in coverPaths))
+
+    def commit(self) -> None:
+        self._connection.commit()
+
+    def close(self) -> None:
+        self._connection.commit()
+        self._connection.close()
+
+class LyricsIndex(object):
+    """
+    In-memory map of every `.lrc` file under the lyrics dir (recursively),
+    keyed by the case-folded file stem.
+
+    `refresh` only lists directories whose mtime changed since the last call,
+    an unchanged tree costs one stat per directory.
+    """
+    def __init__(self, lyricsDir: Path) -> None:
+        self.lyricsDir = lyricsDir
+        self._dirMtimes: dict[str, int] = {}
+        self._dirLyrics: dict[str, dict[str, Path]] = {}
+        self._dirChildren: dict[str, list[str]] = {}
+        self._lyrics: dict[str, Path] = {}
+        self.refresh()
+
+    def refresh(self) -> bool:
+        """Picks up added and removed lyrics files, returns True if anything changed"""
+        seenDirs: set[str] = set()
+        changed = self._refreshDir(str(self.lyricsDir), seenDirs)
+
+        for removedDir in self._dirMtimes.keys() - seenDirs:
+            del self._dirMtimes[removedDir]
+            del self._dirLyrics[removedDir]
+            del self._dirChildren[removedDir]
+            changed = True
+
+        if changed:
+            # when several dirs have the same stem, the shallowest one wins
+            self._lyrics = {}
+            for directory in sorted(self._dirLyrics, key=lambda directory: directory.count(os.sep), reverse=True):
+                self._lyrics.update(self._dirLyrics[directory])
+        return changed
+
+    def _refreshDir(self, directory: str, seenDirs: set[str]) -> bool:
+        try:
+            mtimeNs = os.stat(directory).st_mtime_ns
+        except OSError:
+            return False
+        seenDirs.add(directory)
+
+        changed = False
+        if self._dirMtimes.get(directory) != mtimeNs:
+            lyrics: dict[str, Path] = {}
+            children: list[str] = []
+            try:
+                with os.scandir(directory) as entries:
+                    for entry in entries:
+                        if entry.is_dir(follow_symlinks=False):
+                            children.append(entry.path)
+                        elif entry.name.lower().endswith(".lrc") and entry.is_file():
+                            lyrics[entry.name[:-4].casefold()] = Path(entry.path)
+            except OSError:
+                pass
+            self._dirMtimes[directory] = mtimeNs
+            self._dirLyrics[directory] = lyrics
+            self._dirChildren[directory] = children
+            changed = True
+
+        # a change deep in the tree doesn't touch the mtime of the parents
+        for child in self._dirChildren[directory]:
+            changed = self._refreshDir(child, seenDirs) or changed
+        return changed
+
+    def find(self, mediaPath: Path | str) -> Path | None:
+        stem = os.path.splitext(os.path.basename(mediaPath))[0]
+        return self._lyrics.get(stem.casefold())
+    
+    def getDirectories(self) -> list[str]:
+        return list(self._dirMtimes)
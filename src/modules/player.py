@@ -1,19 +1,38 @@
 import os
+from bisect import bisect_left
 from pathlib import Path
 from random import randint
 from threading import Thread
+from typing import Iterable
 
 from PySide6.QtCore import QUrl, Signal, QObject
 from PySide6.QtMultimedia import QMediaPlayer, QAudioOutput, QAudioDevice
 
-from .types_ import PlayStatus, MediaInfo, MediaItem, SUPPORTED_AUDIO_FORMATS, PlayMode, PlayerStatus
-from .utils import getMediaItemFromPath
+from .types_ import PlayStatus, MediaInfo, MediaItem, PlayMode, PlayerStatus, ScanBackend, ScanStats, ScanPriority, \
+    ScanProgress, LibraryChanges
+from .library import LibraryIndex, LyricsIndex, walkLibrary
+from .scanner import ScanEngine
+from .scanjob import ScanJob, ScanResult
+from .playlist import PlayListSnapshot
+from .cache import CoverCache
+from .watcher import DirectoryWatcher
 
 class Player(QObject):
         
-    playerReady = Signal(list)
+    playerReady = Signal(object)
+    # the snapshot a change leads to, with the first appended row or the changed rows
+    playListBatch = Signal(object, int)
+    scanProgress = Signal(object)
+    scanCancelled = Signal()
+    scanFailed = Signal(object)
+    playListRowsChanged = Signal(object, list)
+    playListRowsRemoved = Signal(object, list)
     onNextSong = Signal(MediaInfo)
     onPreviousSong = Signal(MediaInfo)
+    # the song `next` will most likely play, so its lyrics and cover can be loaded in advance
+    upcomingSongChanged = Signal(MediaInfo)
+    # emitted from a worker thread, handled in the thread of the player
+    _libraryChangesReady = Signal(object)
         
     def __init__(self, 
                  outputDevice: QAudioDevice) -> None:
@@ -27,25 +46,73 @@ class Player(QObject):
         self._playMode = False
         self._playingStatus = PlayStatus.STOPPED
         self._playerStatus = PlayerStatus.READY
-        self._playList: list[MediaItem] = []
+        # replaced as a whole on every change, never modified
+        self._playList = PlayListSnapshot()
         self._currentIndex: int = -1
+        # set when the playing track was removed from the play list, `_currentIndex` is then the row that followed it
+        self._removedSongInfo: MediaInfo | None = None
+        # picked when a song starts, `next` plays it unless the play list changed in between
+        self._upcomingIndex: int = -1
+        self._upcomingGeneration = -1
+        self._scanEngine = ScanEngine()
+        self._coverCacheMaxBytes = 512 * 1024 * 1024
+        self._lyricsIndex: LyricsIndex | None = None
+        self._scanJob: ScanJob | None = None
         
-    def play(self, index: int) -> None:
-        if index < 0:
-            return
-        if self._playerStatus == PlayerStatus.READY:
-            self._currentIndex = index
-            
-            self._mediaPlayer.stop()
-            try:
-                self._mediaPlayer.setSource(
-                    QUrl.fromLocalFile(self._playList[index].mediaPath.absolute().as_posix())
-                )
-            except IndexError:
-                return
-            self._mediaPlayer.play()
+        # what the last scan was run with, live updates reuse it
+        self._musicDirs: list[Path] = []
+        self._lyricsDir = Path("lrc")
+        self._cacheDir = Path("cache")
+        self._excludes: list[str] = []
+        self._walkedDirs: list[str] = []
+        # (size, mtime) of every audio file seen, keyed by path
+        self._trackStats: dict[str, tuple[int, int]] = {}
+        
+        self._watchLibrary = False
+        self._musicWatcher = DirectoryWatcher(parent=self)
+        self._musicWatcher.directoriesChanged.connect(self._onMusicDirsChanged)
+        self._lyricsWatcher = DirectoryWatcher(parent=self)
+        self._lyricsWatcher.directoriesChanged.connect(self._onLyricsDirsChanged)
+        self._pendingMusicDirs: set[str] = set()
+        self._pendingLyricsChange = False
+        self._applyingChanges = False
+        # the worker collecting live changes, a scan waits for it before touching the index
+        self._libraryChangesThread: Thread | None = None
+        self._libraryChangesReady.connect(self._onLibraryChangesCollected)
+        
+    def play(self, index: int, generation: int | None = None) -> bool:
+        """
+        `generation` is the one of the play list `index` was taken from, a stale
+        index is ignored. Returns whether the song started.
+        """
+        if index < 0 or not self.isCurrentGeneration(generation):
+            return False
+        try:
+            path = self._playList.getPath(index)
+        except IndexError:
+            return False
+        # a scan only appends to or replaces the snapshot, playing from it is safe while it runs
+        self._currentIndex = index
+        self._removedSongInfo = None
+        
+        self._mediaPlayer.stop()
+        self._mediaPlayer.setSource(QUrl.fromLocalFile(Path(path).absolute().as_posix()))
+        self._mediaPlayer.play()
+        
+        self._playingStatus = PlayStatus.PLAYING
+        self._predictUpcomingSong()
+        return True
             
-            self._playingStatus = PlayStatus.PLAYING
+    def _predictUpcomingSong(self):
+        if not self._playList:
+            return
+        if self._playMode == PlayMode.RANDOM:
+            # picked now rather than in `next`, so it's known in advance
+            self._upcomingIndex = randint(0, len(self._playList)-1)
+        else:
+            self._upcomingIndex = (self._currentIndex + 1) % len(self._playList)
+        self._upcomingGeneration = self._playList.generation
+        self.upcomingSongChanged.emit(self._playList[self._upcomingIndex].mediaInfo)
         
     def pause(self) -> None: 
         self._mediaPlayer.pause()
@@ -65,11 +132,21 @@ class Player(QObject):
         return self._mediaPlayer.duration()
     
     def getCurrentSongInfo(self) -> MediaInfo:
+        if self._removedSongInfo is not None:
+            return self._removedSongInfo
+        if not 0 <= self._currentIndex < len(self._playList):
+            raise IndexError("no song is playing")
         return self._playList[self._currentIndex].mediaInfo
     
     def next(self) -> None: 
-        if self._playingStatus != PlayStatus.STOPPED:
-            if self._playMode == PlayMode.RANDOM:
+        if self._playingStatus != PlayStatus.STOPPED and self._playList:
+            if self._removedSongInfo is not None and self._playMode != PlayMode.RANDOM:
+                # the track that followed the removed one
+                if self._currentIndex >= len(self._playList):
+                    self._currentIndex = 0
+            elif self._upcomingGeneration == self._playList.generation and 0 <= self._upcomingIndex < len(self._playList):
+                self._currentIndex = self._upcomingIndex
+            elif self._playMode == PlayMode.RANDOM:
                 self._currentIndex = randint(0, len(self._playList)-1)
             else:
                 if self._currentIndex + 1 >= len(self._playList):
@@ -81,11 +158,11 @@ class Player(QObject):
             self.onNextSong.emit(self._playList[self._currentIndex].mediaInfo)
         
     def previous(self) -> None:
-        if self._playingStatus != PlayStatus.STOPPED:
+        if self._playingStatus != PlayStatus.STOPPED and self._playList:
             if self._playMode == PlayMode.RANDOM:
                 self._currentIndex = randint(0, len(self._playList)-1)
             else:
-                if self._currentIndex == 0:
+                if self._currentIndex <= 0:
                     self._currentIndex = len(self._playList) - 1
                 else:
                     self._currentIndex -= 1
@@ -98,7 +175,7 @@ class Player(QObject):
     
     def _onMediaStatusChanged(self, status: QMediaPlayer.MediaStatus) -> None: 
         if status == QMediaPlayer.MediaStatus.EndOfMedia:
-            if self._playMode == PlayMode.LOOP:
+            if self._playMode == PlayMode.LOOP and self._removedSongInfo is None:
                 self.play(self._currentIndex)
             else:
                 self.next()
@@ -108,29 +185,320 @@ class Player(QObject):
     
     def changePlayMode(self, mode: PlayMode):
         self._playMode = mode
+        if self._playingStatus != PlayStatus.STOPPED:
+            self._predictUpcomingSong()
         
     def getPlayerStatus(self) -> PlayerStatus:
         return self._playerStatus
+    
+    def getPlayList(self) -> PlayListSnapshot:
+        return self._playList
+    
+    def isCurrentGeneration(self, generation: int | None) -> bool:
+        return generation is None or generation == self._playList.generation
         
-    def updatePlayList(self, musicDir: Path, lyricsDir: Path, cacheDir: Path):
-        def update():
-            coversDir = cacheDir / "covers"
-            coversDir.mkdir(parents=True, exist_ok=True)
+    def updatePlayList(self, 
+                       musicDirs: list[Path], 
+                       lyricsDir: Path, 
+                       cacheDir: Path, 
+                       excludes: Iterable[str] = (), 
+                       priority: ScanPriority = ScanPriority.HIGH):
+        """Starts a scan of `musicDirs`, a scan that is still running is cancelled"""
+        musicDirs = [musicDir.absolute() for musicDir in musicDirs]
+        excludes = list(excludes)
+        self._musicDirs, self._lyricsDir, self._cacheDir, self._excludes = musicDirs, lyricsDir, cacheDir, excludes
+        
+        job = ScanJob(musicDirs, lyricsDir, cacheDir, excludes, 
+                      self._scanEngine, self._coverCacheMaxBytes, self._lyricsIndex,
+                      dict(self._trackStats), self._playList, priority, 
+                      supersedes=self._scanJob, waitFor=self._libraryChangesThread, parent=self)
+        job.batchReady.connect(self._onScanBatch)
+        job.diffReady.connect(self._onScanDiff)
+        job.progressChanged.connect(self._onScanProgress)
+        job.finished.connect(self._onScanFinished)
+        job.cancelled.connect(self._onScanCancelled)
+        job.failed.connect(self._onScanFailed)
+        
+        self._scanJob = job
+        self._playerStatus = PlayerStatus.PREPARING
+        job.start()
+        
+    def resyncPlayList(self) -> bool:
+        """
+        Scans the dirs of the last scan again, only the differences are applied
+        to the play list. Returns False when there was no scan to repeat.
+        """
+        if not self._musicDirs:
+            return False
+        self.updatePlayList(self._musicDirs, self._lyricsDir, self._cacheDir, self._excludes)
+        return True
+    
+    def cancelScan(self):
+        if self._scanJob is not None:
+            self._scanJob.cancel()
             
-            self._playerStatus = PlayerStatus.PREPARING
+    def pauseScan(self):
+        if self._scanJob is not None:
+            self._scanJob.pause()
+            
+    def resumeScan(self):
+        if self._scanJob is not None:
+            self._scanJob.resume()
+            
+    def setScanPriority(self, priority: ScanPriority):
+        if self._scanJob is not None:
+            self._scanJob.setPriority(priority)
+            
+    def _isCurrentScan(self) -> bool:
+        # signals of a superseded job may still be queued
+        return self._scanJob is not None and self.sender() is self._scanJob
+    
+    def _onScanBatch(self, items: list[MediaItem]):
+        if self._isCurrentScan():
+            firstRow = len(self._playList)
+            self._playList = self._playList.appended(items)
+            self.playListBatch.emit(self._playList, firstRow)
             
-            for targetFile in os.listdir(musicDir):
-                targetFilePath: Path = (musicDir / targetFile).absolute()
-                if targetFile.lower().endswith(SUPPORTED_AUDIO_FORMATS) and targetFilePath.is_file():
-                    try: 
-                        self._playList.append(getMediaItemFromPath(targetFilePath, lyricsDir, coversDir))
-                    except TypeError: 
-                        pass
+    def _onScanDiff(self, changes: LibraryChanges):
+        if self._isCurrentScan():
+            self._applyLibraryChanges(changes)
             
+    def _onScanProgress(self, progress: ScanProgress):
+        if self._isCurrentScan():
+            self.scanProgress.emit(progress)
+            
+    def _releaseScanJob(self, job: QObject):
+        """Called with the last signal of a job, superseded ones included"""
+        if isinstance(job, ScanJob):
+            # the signal is its thread's last step, joining it is quick
+            job.wait()
+            job.deleteLater()
+            
+    def _onScanCancelled(self):
+        if self._isCurrentScan():
+            self._scanJob = None
+            self._playerStatus = PlayerStatus.READY
+            self.scanCancelled.emit()
+            self._collectPendingChanges()
+        self._releaseScanJob(self.sender())
+            
+    def _onScanFailed(self, error: Exception):
+        if self._isCurrentScan():
+            self._scanJob = None
             self._playerStatus = PlayerStatus.READY
+            self.scanFailed.emit(error)
+            self._collectPendingChanges()
+        self._releaseScanJob(self.sender())
+            
+    def _onScanFinished(self, result: ScanResult):
+        self._releaseScanJob(self.sender())
+        if not self._isCurrentScan():
+            return
+        self._scanJob = None
+        self._lyricsIndex = result.lyricsIndex
+        self._trackStats = result.trackStats
+        self._walkedDirs = result.walkedDirs
+        self._playerStatus = PlayerStatus.READY
         
-        self._playListUpdateThread = Thread(target=lambda: (update(), self.playerReady.emit(self._playList)), name="playListUpdateThread")
-        self._playListUpdateThread.start()
+        # directories may have been removed or excluded since the last scan
+        self._musicWatcher.clear()
+        self._lyricsWatcher.clear()
+        self._watchDirectories(result.walkedDirs)
+        
+        self.playerReady.emit(self._playList)
+        self._collectPendingChanges()
         
     def changeOutputDevice(self, outputDevice: QAudioDevice):
         self._audioOutput.setDevice(outputDevice)
+        
+    def changeScanEngine(self, workers: int | None = None, backend: ScanBackend = ScanBackend.THREAD):
+        self._scanEngine = ScanEngine(workers, backend)
+        
+    def changeCoverCacheLimit(self, maxBytes: int):
+        self._coverCacheMaxBytes = maxBytes
+        
+    def getLastScanStats(self) -> ScanStats:
+        return self._scanEngine.getLastStats()
+        
+    def setLibraryWatching(self, enabled: bool):
+        """
+        Watches the music and lyrics dirs of the last scan, added, modified and
+        removed files are applied to the play list in place instead of rescanning
+        """
+        self._watchLibrary = enabled
+        if enabled:
+            self._watchDirectories(self._walkedDirs)
+        else:
+            self._musicWatcher.clear()
+            self._lyricsWatcher.clear()
+            
+    def _watchDirectories(self, musicDirs: list[str]):
+        if not self._watchLibrary:
+            return
+        self._musicWatcher.addDirectories(musicDirs)
+        if self._lyricsIndex is not None:
+            self._lyricsWatcher.addDirectories(self._lyricsIndex.getDirectories())
+            
+    def _onMusicDirsChanged(self, directories: list[str]):
+        self._pendingMusicDirs.update(directories)
+        self._collectPendingChanges()
+        
+    def _onLyricsDirsChanged(self, directories: list[str]):
+        self._pendingLyricsChange = True
+        self._collectPendingChanges()
+        
+    def _collectPendingChanges(self):
+        # one change set at a time, and none while a full scan is running
+        if self._applyingChanges or self._playerStatus == PlayerStatus.PREPARING:
+            return
+        if not self._pendingMusicDirs and not self._pendingLyricsChange:
+            return
+        
+        dirtyDirs = sorted(self._pendingMusicDirs)
+        lyricsChanged = self._pendingLyricsChange
+        self._pendingMusicDirs = set()
+        self._pendingLyricsChange = False
+        self._applyingChanges = True
+        
+        # the worker must not see the stats change under it, the play list never changes
+        knownStats = dict(self._trackStats)
+        playList = self._playList
+        watchedDirs = set(self._musicWatcher.getDirectories())
+        
+        self._libraryChangesThread = Thread(target=self._runLibraryChangesCollection, 
+                                            args=(dirtyDirs, lyricsChanged, knownStats, playList, watchedDirs), 
+                                            name="libraryChangesThread")
+        self._libraryChangesThread.start()
+        
+    def _runLibraryChangesCollection(self, 
+                                     dirtyDirs: list[str], 
+                                     lyricsChanged: bool,
+                                     knownStats: dict[str, tuple[int, int]],
+                                     playList: PlayListSnapshot,
+                                     watchedDirs: set[str]):
+        try:
+            changes = self._collectLibraryChanges(dirtyDirs, lyricsChanged, knownStats, playList, watchedDirs)
+        except Exception:
+            # the changes are picked up again with the next change or resync, collecting must not stall
+            changes = LibraryChanges()
+        self._libraryChangesReady.emit(changes)
+        
+    def _collectLibraryChanges(self, 
+                               dirtyDirs: list[str], 
+                               lyricsChanged: bool,
+                               knownStats: dict[str, tuple[int, int]],
+                               playList: PlayListSnapshot,
+                               watchedDirs: set[str]) -> LibraryChanges:
+        """Runs in a worker thread, only lists the dirty directories and parses the files that changed"""
+        changes = LibraryChanges()
+        changedPaths: list[Path] = []
+        
+        for directory in dirtyDirs:
+            prefix = directory + os.sep
+            listedStats: dict[str, tuple[int, int]] = {}
+            # new sub directories are walked as a whole, the watched ones report their own changes
+            for entry in walkLibrary([Path(directory)], self._excludes, 
+                                     skipDirs=watchedDirs, libraryRoots=self._musicDirs, 
+                                     walkedDirs=changes.newMusicDirs):
+                try:
+                    fileStat = entry.stat()
+                except OSError:
+                    continue
+                listedStats[entry.path] = (fileStat.st_size, fileStat.st_mtime_ns)
+            
+            directoryExists = os.path.isdir(directory)
+            for path in knownStats:
+                if not path.startswith(prefix) or path in listedStats:
+                    continue
+                # files in watched sub directories are only gone with the sub directory itself
+                if not directoryExists or os.sep not in path[len(prefix):]:
+                    changes.removedPaths.append(path)
+                    
+            for path, stats in listedStats.items():
+                if knownStats.get(path) != stats:
+                    changes.fileStats[path] = stats
+                    changedPaths.append(Path(path))
+        
+        lyricsIndex = self._lyricsIndex
+        if lyricsIndex is not None and lyricsChanged and lyricsIndex.refresh():
+            for path, listedLyricsPath in zip(playList.iterPaths(), playList.iterLyricsPaths()):
+                lyricsPath = lyricsIndex.find(path)
+                if (str(lyricsPath) if lyricsPath else None) != listedLyricsPath:
+                    changes.lyricsPaths[path] = lyricsPath
+            changes.newLyricsDirs = lyricsIndex.getDirectories()
+        
+        if changedPaths or changes.removedPaths:
+            coverCache = CoverCache(self._cacheDir / "covers", self._coverCacheMaxBytes)
+            with LibraryIndex(self._cacheDir / "library.db") as index:
+                for source, mediaItem in self._scanEngine.extract(changedPaths, coverCache):
+                    key = str(source)
+                    if mediaItem is None:
+                        # not readable anymore, dropped until the file changes again
+                        del changes.fileStats[key]
+                        changes.removedPaths.append(key)
+                        continue
+                    size, mtimeNs = changes.fileStats[key]
+                    index.upsert(mediaItem, size, mtimeNs)
+                    if lyricsIndex is not None:
+                        mediaItem.mediaInfo.lyricsPath = lyricsIndex.find(mediaItem.mediaPath)
+                    changes.updatedItems.append(mediaItem)
+                index.remove(changes.removedPaths)
+        return changes
+    
+    def _onLibraryChangesCollected(self, changes: LibraryChanges):
+        self._applyingChanges = False
+        self._libraryChangesThread = None
+        self._applyLibraryChanges(changes)
+        self._collectPendingChanges()
+    
+    def _applyLibraryChanges(self, changes: LibraryChanges):
+        """
+        Applies changes found by a worker to the play list without rebuilding it,
+        the current index keeps pointing at the same track
+        """
+        rows = {path: row for row, path in enumerate(self._playList.iterPaths())}
+        
+        changedItems: dict[int, MediaItem] = {}
+        addedItems: list[MediaItem] = []
+        for item in changes.updatedItems:
+            row = rows.get(str(item.mediaPath))
+            if row is None:
+                addedItems.append(item)
+            else:
+                changedItems[row] = item
+        changedLyricsPaths = {rows[path]: str(lyricsPath) if lyricsPath else None 
+                              for path, lyricsPath in changes.lyricsPaths.items() if path in rows}
+        removedRows = sorted({rows[path] for path in changes.removedPaths if path in rows})
+        
+        for path in changes.removedPaths:
+            self._trackStats.pop(path, None)
+        self._trackStats.update(changes.fileStats)
+        
+        # copy on write, every step is published as a snapshot the view can follow
+        if changedItems or changedLyricsPaths:
+            playList = self._playList
+            if changedItems:
+                playList = playList.withReplaced(changedItems)
+            if changedLyricsPaths:
+                playList = playList.withLyricsPaths(changedLyricsPaths)
+            self._playList = playList
+            self.playListRowsChanged.emit(playList, sorted(changedItems.keys() | changedLyricsPaths.keys()))
+            
+        if removedRows:
+            if self._currentIndex >= 0:
+                removedBefore = bisect_left(removedRows, self._currentIndex)
+                if removedBefore < len(removedRows) and removedRows[removedBefore] == self._currentIndex \
+                   and self._removedSongInfo is None:
+                    # the playing track is gone, `next` continues with the track that followed it
+                    self._removedSongInfo = self._playList[self._currentIndex].mediaInfo
+                self._currentIndex -= removedBefore
+            self._playList = self._playList.withRemoved(removedRows)
+            self.playListRowsRemoved.emit(self._playList, removedRows)
+            
+        if addedItems:
+            firstRow = len(self._playList)
+            self._playList = self._playList.appended(addedItems)
+            self.playListBatch.emit(self._playList, firstRow)
+            
+        self._musicWatcher.addDirectories(changes.newMusicDirs)
+        self._lyricsWatcher.addDirectories(changes.newLyricsDirs)
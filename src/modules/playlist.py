@@ -0,0 +1,282 @@
+import sys
+from array import array
+from itertools import compress, count, islice
+from pathlib import Path
+from typing import Iterable, Iterator
+
+from .types_ import MediaInfo, MediaItem, CoverRef, SearchKeys, LyricsRef
+from .searchkeys import SEARCH_KEY_SEPARATOR, getSearchKeys
+
+# a track gets a new id whenever its row is written, so an id always stands for the same data
+_trackIds = count()
+
+class StringPool(object):
+    """
+    Append-only table of strings that repeat across tracks (artists, albums,
+    MIME types), a column stores the id of the string instead of the string.
+    Ids never change, so snapshots of any generation can share one pool.
+    """
+    __slots__ = ("_ids", "_strings")
+
+    def __init__(self) -> None:
+        self._ids: dict[str, int] = {}
+        self._strings: list[str] = []
+
+    def getId(self, string: str) -> int:
+        stringId = self._ids.get(string)
+        if stringId is None:
+            stringId = self._ids[string] = len(self._strings)
+            self._strings.append(string)
+        return stringId
+
+    def getString(self, stringId: int) -> str:
+        return self._strings[stringId]
+
+    def __len__(self) -> int:
+        return len(self._strings)
+
+def _splitFieldKeys(searchKeys: SearchKeys) -> list[str]:
+    """
+    The keys of each field on its own: the normalized field, followed by its
+    pinyin and initials only if it has Chinese, so the keys of an artist are
+    the same string in every track of theirs
+    """
+    normalizedFields = searchKeys.normalized.split(SEARCH_KEY_SEPARATOR)
+    if searchKeys.pinyin is None or searchKeys.initials is None:
+        return normalizedFields
+    fieldKeys = zip(normalizedFields,
+                    searchKeys.pinyin.split(SEARCH_KEY_SEPARATOR),
+                    searchKeys.initials.split(SEARCH_KEY_SEPARATOR))
+    return [normalized if normalized == pinyin == initials else SEARCH_KEY_SEPARATOR.join((normalized, pinyin, initials))
+            for normalized, pinyin, initials in fieldKeys]
+
+def _joinFieldKeys(fieldKeys: Iterable[str]) -> SearchKeys:
+    splitKeys = [keys.split(SEARCH_KEY_SEPARATOR) for keys in fieldKeys]
+    normalized = SEARCH_KEY_SEPARATOR.join(keys[0] for keys in splitKeys)
+    if all(len(keys) == 1 for keys in splitKeys):
+        return SearchKeys(normalized, None, None)
+    # a field without Chinese reads the same in all three keys
+    return SearchKeys(normalized,
+                      SEARCH_KEY_SEPARATOR.join(keys[1] if len(keys) > 1 else keys[0] for keys in splitKeys),
+                      SEARCH_KEY_SEPARATOR.join(keys[2] if len(keys) > 1 else keys[0] for keys in splitKeys))
+
+class _Columns(object):
+    """The play list stored column by column, one entry per track in every column"""
+    __slots__ = ("trackIds", "paths", "titles", "artistIds", "albumIds", "lengthsMs",
+                 "coverSources", "coverOffsets", "coverLengths", "coverMimeIds", "lyricsPaths",
+                 "titleKeys", "artistKeyIds", "albumKeyIds", "embeddedLyricsTagIds")
+
+    def __init__(self) -> None:
+        self.trackIds = array("Q")
+        self.paths: list[str] = []
+        self.titles: list[str] = []
+        self.artistIds = array("I")
+        self.albumIds = array("I")
+        # 32 bit is enough for 24 days
+        self.lengthsMs = array("i")
+        # None when there is no cover, the track's own path string when the cover is embedded
+        self.coverSources: list[str | None] = []
+        self.coverOffsets = array("q")
+        self.coverLengths = array("q")
+        self.coverMimeIds = array("I")
+        self.lyricsPaths: list[str | None] = []
+        # search keys by field, see `_joinFieldKeys`, artists and albums repeat so theirs are pooled
+        self.titleKeys: list[str] = []
+        self.artistKeyIds = array("I")
+        self.albumKeyIds = array("I")
+        # the tag holding the lyrics inside the track, the id of "" when there are none
+        self.embeddedLyricsTagIds = array("I")
+
+    def __len__(self) -> int:
+        return len(self.paths)
+
+    def copy(self, length: int) -> "_Columns":
+        columns = _Columns()
+        for name in self.__slots__:
+            setattr(columns, name, getattr(self, name)[:length])
+        return columns
+
+    def compressed(self, keep: bytes) -> "_Columns":
+        """A copy with the rows whose byte in `keep` is zero left out"""
+        columns = _Columns()
+        for name in self.__slots__:
+            column = getattr(self, name)
+            kept = compress(column, keep)
+            setattr(columns, name, array(column.typecode, kept) if isinstance(column, array) else list(kept))
+        return columns
+
+    def append(self, item: MediaItem, pool: StringPool):
+        path = str(item.mediaPath)
+        info = item.mediaInfo
+        self.trackIds.append(next(_trackIds))
+        self.paths.append(path)
+        self.titles.append(info.title)
+        self.artistIds.append(pool.getId(info.artist))
+        self.albumIds.append(pool.getId(info.album))
+        self.lengthsMs.append(info.lengthMs)
+        self.lyricsPaths.append(str(info.lyricsPath) if info.lyricsPath else None)
+        self._appendCover(path, info.cover, pool)
+        # only items that weren't scanned, e.g. built by hand, lack the keys
+        searchKeys = info.searchKeys or getSearchKeys(info.title, info.artist, info.album)
+        titleKeys, artistKeys, albumKeys = _splitFieldKeys(searchKeys)
+        self.titleKeys.append(titleKeys)
+        self.artistKeyIds.append(pool.getId(artistKeys))
+        self.albumKeyIds.append(pool.getId(albumKeys))
+        self.embeddedLyricsTagIds.append(pool.getId(info.embeddedLyrics.tag if info.embeddedLyrics else ""))
+
+    def _appendCover(self, path: str, cover: CoverRef | None, pool: StringPool):
+        if cover is None:
+            self.coverSources.append(None)
+            self.coverOffsets.append(0)
+            self.coverLengths.append(0)
+            self.coverMimeIds.append(0)
+            return
+        coverSource = str(cover.sourcePath)
+        # covers in the cache are shared by the tracks of an album
+        self.coverSources.append(path if coverSource == path else sys.intern(coverSource))
+        self.coverOffsets.append(cover.offset)
+        self.coverLengths.append(cover.length)
+        self.coverMimeIds.append(pool.getId(cover.mimeType))
+
+    def set(self, row: int, item: MediaItem, pool: StringPool):
+        # appending then moving keeps the conversions in one place
+        self.append(item, pool)
+        for name in self.__slots__:
+            column = getattr(self, name)
+            column[row] = column.pop()
+
+class PlayListSnapshot(object):
+    """
+    Immutable view of the play list, tagged with a generation number.
+
+    Every change publishes a new snapshot with the next generation, an index
+    obtained from one generation can be checked against the current one before
+    it's used. Readers just keep a reference, there is nothing to lock.
+
+    Tracks are stored in columns: paths and titles as strings, artists, albums,
+    their search keys and MIME types as ids into a shared `StringPool`, numbers
+    in typed arrays.
+    `MediaItem` objects, and their `Path`s, are only created when a track is
+    read as a whole, the getters read a single field without creating anything.
+
+    Appending shares the columns: a snapshot only sees its first `length` rows,
+    so rows appended behind it don't change what it shows. Any other change
+    copies the columns.
+    """
+    __slots__ = ("generation", "_columns", "_length", "_pool")
+
+    def __init__(self,
+                 columns: _Columns | None = None,
+                 pool: StringPool | None = None,
+                 generation: int = 0,
+                 length: int | None = None) -> None:
+        self._columns = columns if columns is not None else _Columns()
+        self._pool = pool if pool is not None else StringPool()
+        self._length = len(self._columns) if length is None else length
+        self.generation = generation
+
+    def __len__(self) -> int:
+        return self._length
+
+    def _checkRow(self, row: int) -> int:
+        if row < 0:
+            row += self._length
+        if not 0 <= row < self._length:
+            raise IndexError("play list index out of range")
+        return row
+
+    def __getitem__(self, row: int) -> MediaItem:
+        row = self._checkRow(row)
+        columns = self._columns
+        lyricsPath = columns.lyricsPaths[row]
+        info = MediaInfo(columns.titles[row],
+                         self._pool.getString(columns.artistIds[row]),
+                         self._pool.getString(columns.albumIds[row]),
+                         columns.lengthsMs[row],
+                         self.getCover(row),
+                         Path(lyricsPath) if lyricsPath else None,
+                         self.getSearchKeys(row),
+                         self.getEmbeddedLyrics(row))
+        return MediaItem(Path(columns.paths[row]), info)
+
+    def __iter__(self) -> Iterator[MediaItem]:
+        return (self[row] for row in range(self._length))
+
+    def getTrackId(self, row: int) -> int:
+        return self._columns.trackIds[self._checkRow(row)]
+
+    def getPath(self, row: int) -> str:
+        return self._columns.paths[self._checkRow(row)]
+
+    def getTitle(self, row: int) -> str:
+        return self._columns.titles[self._checkRow(row)]
+
+    def getArtist(self, row: int) -> str:
+        return self._pool.getString(self._columns.artistIds[self._checkRow(row)])
+
+    def getAlbum(self, row: int) -> str:
+        return self._pool.getString(self._columns.albumIds[self._checkRow(row)])
+
+    def getLengthMs(self, row: int) -> int:
+        return self._columns.lengthsMs[self._checkRow(row)]
+
+    def getCover(self, row: int) -> CoverRef | None:
+        row = self._checkRow(row)
+        columns = self._columns
+        coverSource = columns.coverSources[row]
+        if coverSource is None:
+            return None
+        return CoverRef(Path(coverSource), columns.coverOffsets[row], columns.coverLengths[row],
+                        self._pool.getString(columns.coverMimeIds[row]))
+
+    def getLyricsPath(self, row: int) -> str | None:
+        return self._columns.lyricsPaths[self._checkRow(row)]
+
+    def getSearchKeys(self, row: int) -> SearchKeys:
+        row = self._checkRow(row)
+        columns = self._columns
+        return _joinFieldKeys((columns.titleKeys[row],
+                               self._pool.getString(columns.artistKeyIds[row]),
+                               self._pool.getString(columns.albumKeyIds[row])))
+
+    def getEmbeddedLyrics(self, row: int) -> LyricsRef | None:
+        row = self._checkRow(row)
+        tag = self._pool.getString(self._columns.embeddedLyricsTagIds[row])
+        return LyricsRef(Path(self._columns.paths[row]), tag) if tag else None
+
+    def iterTrackIds(self) -> Iterator[int]:
+        return islice(self._columns.trackIds, self._length)
+
+    def iterPaths(self) -> Iterator[str]:
+        return islice(self._columns.paths, self._length)
+
+    def iterLyricsPaths(self) -> Iterator[str | None]:
+        return islice(self._columns.lyricsPaths, self._length)
+
+    def appended(self, items: Iterable[MediaItem]) -> "PlayListSnapshot":
+        if len(self._columns) == self._length:
+            # nothing was appended behind this snapshot yet, the older ones can't see the new rows
+            columns = self._columns
+        else:
+            columns = self._columns.copy(self._length)
+        for item in items:
+            columns.append(item, self._pool)
+        return PlayListSnapshot(columns, self._pool, self.generation + 1)
+
+    def withReplaced(self, rowItems: dict[int, MediaItem]) -> "PlayListSnapshot":
+        columns = self._columns.copy(self._length)
+        for row, item in rowItems.items():
+            columns.set(self._checkRow(row), item, self._pool)
+        return PlayListSnapshot(columns, self._pool, self.generation + 1)
+
+    def withLyricsPaths(self, rowLyricsPaths: dict[int, str | None]) -> "PlayListSnapshot":
+        columns = self._columns.copy(self._length)
+        for row, lyricsPath in rowLyricsPaths.items():
+            columns.lyricsPaths[self._checkRow(row)] = lyricsPath
+        return PlayListSnapshot(columns, self._pool, self.generation + 1)
+
+    def withRemoved(self, rows: Iterable[int]) -> "PlayListSnapshot":
+        keep = bytearray(b"\x01") * self._length
+        for row in rows:
+            keep[self._checkRow(row)] = 0
+        return PlayListSnapshot(self._columns.compressed(bytes(keep)), self._pool, self.generation + 1)
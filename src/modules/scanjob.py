@@ -0,0 +1,276 @@
+import os
+from contextlib import closing
+from dataclasses import dataclass, replace
+from pathlib import Path
+from threading import Event, Thread
+from time import perf_counter
+from typing import Iterable, Iterator
+
+from PySide6.QtCore import QObject, Signal
+
+from .types_ import MediaItem, LibraryChanges, ScanPriority, ScanProgress
+from .library import LibraryIndex, LyricsIndex, walkLibrary
+from .scanner import ScanEngine
+from .cache import CoverCache
+from .playlist import PlayListSnapshot
+
+@dataclass
+class ScanResult:
+    """What a finished scan leaves behind for live updates and the next resync"""
+    lyricsIndex: LyricsIndex
+    # (size, mtime) of every audio file seen, keyed by path
+    trackStats: dict[str, tuple[int, int]]
+    walkedDirs: list[str]
+
+class ScanJob(QObject):
+    """
+    A single scan of the music dirs, run in its own thread.
+
+    With an empty `playList` the tracks are sent in batches as they're found.
+    Otherwise the scan is a resync: only files whose (size, mtime) differ from
+    `knownStats` are parsed, and the differences to `playList` are sent as one
+    `LibraryChanges` at the end.
+
+    The job can be paused, resumed, re-prioritised and cancelled while it runs,
+    a cancelled job emits `cancelled` instead of `finished`, a job that raised
+    emits `failed` with the error. A job started with `supersedes` cancels that
+    job and waits for it before touching the index, as well as for `waitFor`,
+    e.g. a thread applying live changes to the same index.
+    """
+    # a batch of scanned items is sent when it's full or too old
+    _BATCH_SIZE = 200
+    _BATCH_INTERVAL_S = 0.1
+
+    batchReady = Signal(list)
+    diffReady = Signal(object)
+    progressChanged = Signal(object)
+    finished = Signal(object)
+    cancelled = Signal()
+    failed = Signal(object)
+
+    def __init__(self,
+                 musicDirs: list[Path],
+                 lyricsDir: Path,
+                 cacheDir: Path,
+                 excludes: Iterable[str],
+                 engine: ScanEngine,
+                 coverCacheMaxBytes: int,
+                 lyricsIndex: LyricsIndex | None = None,
+                 knownStats: dict[str, tuple[int, int]] | None = None,
+                 playList: PlayListSnapshot | None = None,
+                 priority: ScanPriority = ScanPriority.HIGH,
+                 supersedes: "ScanJob | None" = None,
+                 waitFor: Thread | None = None,
+                 parent: QObject | None = None) -> None:
+        super().__init__(parent)
+        self._musicDirs = musicDirs
+        self._lyricsDir = lyricsDir
+        self._cacheDir = cacheDir
+        self._excludes = list(excludes)
+        self._engine = engine
+        self._coverCacheMaxBytes = coverCacheMaxBytes
+        self._lyricsIndex = lyricsIndex
+        self._knownStats = knownStats or {}
+        self._playList = playList if playList is not None else PlayListSnapshot()
+        self._priority = priority
+        self._supersedes = supersedes
+        self._waitFor = waitFor
+
+        self._cancelEvent = Event()
+        self._resumeEvent = Event()
+        self._resumeEvent.set()
+        self._thread: Thread | None = None
+
+    def start(self):
+        self._thread = Thread(target=self._run, name="scanJobThread")
+        self._thread.start()
+
+    def cancel(self):
+        self._cancelEvent.set()
+        # a paused job has to wake up to notice
+        self._resumeEvent.set()
+
+    def isCancelled(self) -> bool:
+        return self._cancelEvent.is_set()
+
+    def pause(self):
+        if not self._cancelEvent.is_set():
+            self._resumeEvent.clear()
+
+    def resume(self):
+        self._resumeEvent.set()
+
+    def isPaused(self) -> bool:
+        return not self._resumeEvent.is_set()
+
+    def setPriority(self, priority: ScanPriority):
+        self._priority = priority
+
+    def getPriority(self) -> ScanPriority:
+        return self._priority
+
+    def wait(self, timeout: float | None = None):
+        if self._thread is not None:
+            self._thread.join(timeout)
+
+    def _getMaxInFlight(self) -> int:
+        # LOW leaves the CPU and the disk to playback, HIGH also reads ahead to hide I/O latency
+        workers = self._engine.getWorkerCount()
+        if self._priority == ScanPriority.LOW:
+            return 1
+        elif self._priority == ScanPriority.NORMAL:
+            return workers
+        return workers * 4
+
+    def _run(self):
+        try:
+            self._scan()
+        except Exception as error:
+            # otherwise nothing would ever tell the player the scan is over
+            self.failed.emit(error)
+        finally:
+            # what the scan was started with is a full copy of the library, it isn't needed anymore
+            self._knownStats = {}
+            self._playList = PlayListSnapshot()
+            self._lyricsIndex = None
+
+    def _scan(self):
+        if self._supersedes is not None:
+            self._supersedes.cancel()
+            self._supersedes.wait()
+            self._supersedes = None
+        if self._waitFor is not None:
+            self._waitFor.join()
+            self._waitFor = None
+        if self._cancelEvent.is_set():
+            self.cancelled.emit()
+            return
+
+        startTime = perf_counter()
+        pausedS = 0.0
+        walkFinished = False
+        progress = ScanProgress()
+
+        def emitProgress():
+            progress.elapsedS = perf_counter() - startTime - pausedS
+            remainingFiles = progress.filesSeen - progress.filesProcessed
+            if walkFinished and progress.filesProcessed and progress.elapsedS > 0:
+                progress.etaS = remainingFiles * progress.elapsedS / progress.filesProcessed
+            # a copy, the counters keep changing in this thread
+            self.progressChanged.emit(replace(progress))
+
+        # lyrics may change independently of the audio files, so they're never stored in the index
+        lyricsIndex = self._lyricsIndex
+        if lyricsIndex is None or lyricsIndex.lyricsDir != self._lyricsDir:
+            lyricsIndex = LyricsIndex(self._lyricsDir)
+        else:
+            lyricsIndex.refresh()
+        coverCache = CoverCache(self._cacheDir / "covers", self._coverCacheMaxBytes)
+
+        # a resync only parses and sends what changed since the list was built
+        resync = bool(self._playList)
+        changes = LibraryChanges()
+
+        with LibraryIndex(self._cacheDir / "library.db") as index:
+            knownTracks = index.loadAll()
+            seenTracks: set[str] = set()
+            changedFileStats: dict[Path, os.stat_result] = {}
+            trackStats: dict[str, tuple[int, int]] = {}
+            walkedDirs: list[str] = []
+
+            def sources() -> Iterator[Path | MediaItem]:
+                nonlocal pausedS, walkFinished
+                # extraction starts while the walk is still going
+                for entry in walkLibrary(self._musicDirs, self._excludes, walkedDirs=walkedDirs):
+                    if not self._resumeEvent.is_set():
+                        pauseStartTime = perf_counter()
+                        self._resumeEvent.wait()
+                        pausedS += perf_counter() - pauseStartTime
+                    if self._cancelEvent.is_set():
+                        return
+
+                    try:
+                        fileStat = entry.stat()
+                    except OSError:
+                        progress.errors += 1
+                        continue
+
+                    key = entry.path
+                    targetFilePath = Path(key)
+                    seenTracks.add(key)
+                    progress.filesSeen += 1
+                    trackStats[key] = (fileStat.st_size, fileStat.st_mtime_ns)
+                    if self._knownStats.get(key) == trackStats[key]:
+                        progress.filesProcessed += 1
+                        continue
+
+                    record = knownTracks.get(key)
+                    if record and record.size == fileStat.st_size and record.mtimeNs == fileStat.st_mtime_ns:
+                        yield MediaItem(targetFilePath, record.mediaInfo)
+                    else:
+                        changedFileStats[targetFilePath] = fileStat
+                        yield targetFilePath
+                walkFinished = True
+
+            def onError(mediaPath: Path, error: Exception):
+                progress.errors += 1
+
+            batch: list[MediaItem] = []
+            lastFlushTime = perf_counter()
+
+            with closing(self._engine.extract(sources(), coverCache, self._getMaxInFlight, onError)) as results:
+                for source, mediaItem in results:
+                    if self._cancelEvent.is_set():
+                        break
+                    progress.filesProcessed += 1
+                    if isinstance(source, Path):
+                        fileStat = changedFileStats.pop(source)
+                        progress.filesParsed += 1
+                        progress.parsedBytes += fileStat.st_size
+                        if mediaItem is not None:
+                            index.upsert(mediaItem, fileStat.st_size, fileStat.st_mtime_ns)
+
+                    if mediaItem is not None:
+                        mediaItem.mediaInfo.lyricsPath = lyricsIndex.find(mediaItem.mediaPath)
+                        if resync:
+                            changes.updatedItems.append(mediaItem)
+                            changes.fileStats[str(mediaItem.mediaPath)] = trackStats[str(mediaItem.mediaPath)]
+                        else:
+                            batch.append(mediaItem)
+                    elif resync:
+                        # an unreadable file may still be in the list
+                        changes.removedPaths.append(str(source if isinstance(source, Path) else source.mediaPath))
+
+                    if len(batch) >= self._BATCH_SIZE or perf_counter() - lastFlushTime >= self._BATCH_INTERVAL_S:
+                        if batch:
+                            self.batchReady.emit(batch)
+                            batch = []
+                        emitProgress()
+                        lastFlushTime = perf_counter()
+
+            # what was parsed so far stays in the index, it's still valid
+            if self._cancelEvent.is_set():
+                self.cancelled.emit()
+                return
+
+            if batch:
+                self.batchReady.emit(batch)
+
+            index.remove(knownTracks.keys() - seenTracks)
+
+            # covers are only written when something was parsed
+            if progress.filesParsed > 0:
+                # tracks that lost their cover are parsed again on the next scan
+                index.removeByCoverPaths(coverCache.enforceLimit())
+
+        if resync:
+            # compared to the list itself, it may hold tracks of a cancelled scan
+            changes.removedPaths.extend(set(self._playList.iterPaths()) - seenTracks)
+            for path, listedLyricsPath in zip(self._playList.iterPaths(), self._playList.iterLyricsPaths()):
+                lyricsPath = lyricsIndex.find(path)
+                if (str(lyricsPath) if lyricsPath else None) != listedLyricsPath:
+                    changes.lyricsPaths[path] = lyricsPath
+            self.diffReady.emit(changes)
+
+        emitProgress()
+        self.finished.emit(ScanResult(lyricsIndex, trackStats, walkedDirs))
@@ -0,0 +1,105 @@
+import os
+from collections import deque
+from concurrent.futures import Executor, Future, ThreadPoolExecutor, ProcessPoolExecutor
+from pathlib import Path
+from time import perf_counter
+from typing import Callable, Generator, Iterable
+
+from .types_ import MediaItem, ScanBackend, ScanStats
+from .utils import getMediaItemFromPath
+from .cache import CoverCache
+
+def _extractMediaItem(mediaPath: Path, coverCache: CoverCache) -> MediaItem | None:
+    # module level so that it can be pickled by the process backend
+    try:
+        return getMediaItemFromPath(mediaPath, coverCache)
+    except TypeError:
+        return None
+
+class ScanEngine(object):
+    """
+    Spreads tag extraction across a pool of workers.
+
+    `ScanBackend.THREAD` overlaps file I/O and is the cheapest to start,
+    `ScanBackend.PROCESS` also runs mutagen's parsing in parallel, which helps
+    when the files are on a fast local disk and the GIL becomes the bottleneck.
+    """
+    def __init__(self, workers: int | None = None, backend: ScanBackend = ScanBackend.THREAD) -> None:
+        self._workers = workers
+        self._backend = backend
+        self._lastStats = ScanStats(0, 0.0)
+
+    def getWorkerCount(self) -> int:
+        if self._workers:
+            return self._workers
+        # same defaults as concurrent.futures
+        if self._backend == ScanBackend.PROCESS:
+            return os.cpu_count() or 1
+        return min(32, (os.cpu_count() or 1) + 4)
+
+    def _createExecutor(self) -> Executor:
+        if self._backend == ScanBackend.PROCESS:
+            return ProcessPoolExecutor(max_workers=self.getWorkerCount())
+        return ThreadPoolExecutor(max_workers=self.getWorkerCount(), thread_name_prefix="scanWorker")
+
+    def extract(self,
+                sources: Iterable[Path | MediaItem],
+                coverCache: CoverCache,
+                maxInFlight: Callable[[], int] | None = None,
+                onError: Callable[[Path, Exception], None] | None = None) \
+        -> Generator[tuple[Path | MediaItem, MediaItem | None], None, None]:
+        """
+        Yields `(source, result)` pairs in the same order as `sources`.
+
+        A `Path` source is parsed by the pool and its result is None if the file
+        isn't a supported audio file or couldn't be parsed, in which case `onError`
+        is called with the error. A `MediaItem` source (e.g. loaded from the
+        library index) is passed through untouched while keeping its position.
+        `sources` is consumed lazily, only a few tasks per worker are in flight,
+        `maxInFlight` overrides that number and is polled before every task so a
+        running extraction can be throttled. Closing the iterator early drops
+        the tasks that haven't started yet.
+        """
+        parsedFiles = 0
+        startTime = perf_counter()
+        defaultInFlight = self.getWorkerCount() * 4
+
+        with self._createExecutor() as executor:
+            pending: deque[tuple[Path | MediaItem, Future | None]] = deque()
+            try:
+                for source in sources:
+                    if isinstance(source, Path):
+                        pending.append((source, executor.submit(_extractMediaItem, source, coverCache)))
+                        parsedFiles += 1
+                    else:
+                        pending.append((source, None))
+
+                    maxPending = maxInFlight() if maxInFlight else defaultInFlight
+                    while len(pending) > maxPending or (pending and pending[0][1] is None):
+                        yield self._popResult(pending, onError)
+
+                while pending:
+                    yield self._popResult(pending, onError)
+            finally:
+                for _, future in pending:
+                    if future is not None:
+                        future.cancel()
+
+        self._lastStats = ScanStats(parsedFiles, perf_counter() - startTime)
+
+    @staticmethod
+    def _popResult(pending: deque[tuple[Path | MediaItem, Future | None]], 
+                   onError: Callable[[Path, Exception], None] | None) -> tuple[Path | MediaItem, MediaItem | None]:
+        source, future = pending.popleft()
+        if future is None:
+            return source, source # pyright: ignore[reportReturnType]
+        try:
+            return source, future.result()
+        except Exception as error:
+            # a broken file must not end the whole scan
+            if onError is not None:
+                onError(source, error) # pyright: ignore[reportArgumentType]
+            return source, None
+
+    def getLastStats(self) -> ScanStats:
+        return self._lastStats
@@ -0,0 +1,240 @@
+import locale
+import traceback
+from array import array
+from bisect import insort
+from dataclasses import dataclass
+from queue import Queue
+from threading import Thread, Lock
+from typing import Callable, Iterable, Sequence
+from itertools import compress, pairwise
+from operator import itemgetter
+
+from PySide6.QtCore import QObject, Signal
+
+from .playlist import PlayListSnapshot
+from .searchkeys import SEARCH_KEY_SEPARATOR, normalizeText
+
+def getSearchText(playList: PlayListSnapshot, row: int) -> str:
+    """The search keys of a track in one string, separated and padded so no match spans two keys"""
+    searchKeys = playList.getSearchKeys(row)
+    keys = [searchKeys.normalized]
+    if searchKeys.pinyin is not None and searchKeys.initials is not None:
+        keys += [searchKeys.pinyin, searchKeys.initials]
+    return SEARCH_KEY_SEPARATOR + SEARCH_KEY_SEPARATOR.join(keys) + SEARCH_KEY_SEPARATOR
+
+def getTrigrams(text: str) -> set[str]:
+    return {text[i:i + 3] for i in range(len(text) - 2)}
+
+def getShortGrams(text: str) -> set[str]:
+    """The unigrams and bigrams of the keys in a search text, a query that short is looked up as it is"""
+    grams = {text[i:i + 2] for i in range(len(text) - 1)}
+    grams.update(text)
+    return {gram for gram in grams if SEARCH_KEY_SEPARATOR not in gram}
+
+def getCollationKeys(playList: PlayListSnapshot, row: int) -> list[str]:
+    """Collation keys of title, artist and album, Chinese is sorted by its pinyin among the rest"""
+    searchKeys = playList.getSearchKeys(row)
+    fields = (searchKeys.pinyin or searchKeys.normalized).split(SEARCH_KEY_SEPARATOR)
+    return [locale.strxfrm(field) for field in fields]
+
+@dataclass(frozen=True, slots=True)
+class SearchQuery:
+    """What the play list view shows: the rows matching `text`, in the order of a column"""
+    text: str = ""
+    # a column of the play list model, the play list order if negative
+    sortColumn: int = -1
+    descending: bool = False
+
+class SearchIndex(QObject):
+    """
+    Trigram index over the title, artist and album of every track of the play list,
+    Chinese can also be searched by its pinyin or initials. Unigrams and bigrams
+    have postings of their own, so queries too short for a trigram are answered
+    without looking at the texts.
+
+    The index keeps its own list of the tracks it has seen, postings hold
+    positions in that list. Tracks are identified by their track id rather than
+    their row, so rows can be removed from the play list without touching the
+    index: positions whose id isn't in the searched snapshot are left out of the
+    results. A replaced row gets a new id, the index only needs to learn that one.
+
+    Sort keys of every track are computed once when it's indexed, the order of
+    every column is kept as a permutation of positions. New tracks are merged
+    into it, so sorting only maps positions to rows.
+
+    Indexing and searching both run on one worker thread, in the order they were
+    requested. Only the latest query is answered, `resultsReady` delivers the
+    matching rows of the snapshot the query was made against, in view order.
+    """
+    # the columns of the play list model
+    TITLE_COLUMN, ARTIST_COLUMN, ALBUM_COLUMN, LENGTH_COLUMN = range(4)
+
+    resultsReady = Signal(object, object, object)
+
+    def __init__(self, parent: QObject | None = None) -> None:
+        super().__init__(parent)
+        self._positions: dict[int, int] = {}
+        self._texts: list[str] = []
+        self._postings: dict[str, array] = {}
+        # collation keys of title, artist and album, and the lengths, by position
+        self._collationKeys: tuple[list[str], list[str], list[str]] = ([], [], [])
+        self._lengthsMs = array("i")
+        # positions in the order of each column, those indexed since are merged in when it's sorted again
+        self._sortedPositions: dict[int, list[int]] = {}
+        # snapshot row of every position, -1 if the track isn't in it, rebuilt when the generation changes
+        self._rows = array("i")
+        self._rowsGeneration = -1
+        self._rowsAscending = True
+        # every position is its own row, nothing was removed or replaced since the tracks were indexed
+        self._rowsIdentical = True
+        # the rows in the order of each column, built on the first sort of a snapshot
+        self._orderedRows: dict[int, tuple[array, Callable[[bytearray], Sequence[int]]]] = {}
+        # (query, number of indexed tracks, positions it matched), typing on only has to filter these
+        self._lastMatch: tuple[str, int, Sequence[int]] | None = None
+
+        self._tasks: Queue = Queue()
+        self._latestQueryLock = Lock()
+        # every query gets the next number, a queued one is only answered while it's still the latest
+        self._latestQueryNumber = 0
+        self._thread = Thread(target=self._run, name="searchIndexThread", daemon=True)
+        self._thread.start()
+
+    def addTracks(self, playList: PlayListSnapshot, rows: Iterable[int]):
+        """Indexes `rows` of `playList`, e.g. the rows a scan batch appended or a change replaced"""
+        self._tasks.put((self._index, playList, rows))
+
+    def search(self, query: SearchQuery, playList: PlayListSnapshot):
+        with self._latestQueryLock:
+            self._latestQueryNumber += 1
+            queryNumber = self._latestQueryNumber
+        # queued behind the tracks added so far, so `playList` is fully indexed when it's answered
+        self._tasks.put((self._answer, queryNumber, query, playList))
+
+    def _run(self):
+        while True:
+            task, *arguments = self._tasks.get()
+            try:
+                task(*arguments)
+            except Exception:
+                # one failed task must not stop searching for the rest of the session
+                traceback.print_exc()
+
+    def _index(self, playList: PlayListSnapshot, rows: Iterable[int]):
+        postings = self._postings
+        self._orderedRows.clear()
+        for row in rows:
+            trackId = playList.getTrackId(row)
+            # e.g. only the lyrics path of the row changed
+            if trackId in self._positions:
+                continue
+            position = self._positions[trackId] = len(self._texts)
+            # the rows were built for fewer positions
+            self._rowsGeneration = -1
+            text = getSearchText(playList, row)
+            for keys, key in zip(self._collationKeys, getCollationKeys(playList, row)):
+                keys.append(key)
+            self._lengthsMs.append(playList.getLengthMs(row))
+            self._texts.append(text)
+            for gram in getTrigrams(text) | getShortGrams(text):
+                posting = postings.get(gram)
+                if posting is None:
+                    posting = postings[gram] = array("I")
+                # positions only grow, so every posting stays sorted
+                posting.append(position)
+
+    def _answer(self, queryNumber: int, query: SearchQuery, playList: PlayListSnapshot):
+        with self._latestQueryLock:
+            # a newer query replaced it, only that one is answered
+            if queryNumber != self._latestQueryNumber:
+                return
+        self.resultsReady.emit(query, playList, self._search(query, playList))
+
+    def _search(self, query: SearchQuery, playList: PlayListSnapshot) -> array | None:
+        """The rows to show, None when that's every row in play list order"""
+        text = normalizeText(query.text).replace(SEARCH_KEY_SEPARATOR, "")
+        filtered = bool(text.strip())
+        if not filtered and query.sortColumn < 0:
+            return None
+
+        if self._rowsGeneration != playList.generation:
+            self._updateRows(playList)
+        rows = self._rows
+
+        if query.sortColumn < 0:
+            if self._rowsIdentical:
+                return array("I", self._findPositions(text))
+            matches = [row for position in self._findPositions(text) if (row := rows[position]) >= 0]
+            if not self._rowsAscending:
+                matches.sort()
+            return array("I", matches)
+
+        orderedRows, getInOrder = self._getOrderedRows(query.sortColumn)
+        if not filtered:
+            return orderedRows[::-1] if query.descending else array("I", orderedRows)
+        isMatch = bytearray(len(self._texts))
+        for position in self._findPositions(text):
+            isMatch[position] = 1
+        isMatchInOrder = getInOrder(isMatch)
+        if query.descending:
+            return array("I", compress(reversed(orderedRows), reversed(isMatchInOrder)))
+        return array("I", compress(orderedRows, isMatchInOrder))
+
+    def _getOrderedRows(self, column: int) -> tuple[array, Callable[[bytearray], Sequence[int]]]:
+        """
+        The rows of the searched snapshot in the order of `column`, and a function
+        picking the items of a sequence indexed by position in the same order.
+        Kept until the snapshot or the index changes.
+        """
+        ordered = self._orderedRows.get(column)
+        if ordered is None:
+            rows = self._rows
+            orderedPositions = [position for position in self._getSortedPositions(column) if rows[position] >= 0]
+            orderedRows = array("I", [rows[position] for position in orderedPositions])
+            # itemgetter picks them in one call, but only returns a tuple for two or more items
+            getInOrder = itemgetter(*orderedPositions) if len(orderedPositions) > 1 \
+                else lambda sequence: [sequence[position] for position in orderedPositions]
+            ordered = self._orderedRows[column] = (orderedRows, getInOrder)
+        return ordered
+
+    def _getSortedPositions(self, column: int) -> list[int]:
+        sortedPositions = self._sortedPositions.setdefault(column, [])
+        newPositions = range(len(sortedPositions), len(self._texts))
+        keys = self._lengthsMs if column == self.LENGTH_COLUMN else self._collationKeys[column]
+        if len(newPositions) * 16 < len(sortedPositions):
+            # a scan batch or a few changed tracks, new positions go after their equals like in a stable sort
+            for position in newPositions:
+                insort(sortedPositions, position, key=keys.__getitem__)
+        elif newPositions:
+            sortedPositions.extend(newPositions)
+            sortedPositions.sort(key=keys.__getitem__)
+        return sortedPositions
+
+    def _findPositions(self, query: str) -> Iterable[int]:
+        texts = self._texts
+        if len(query) <= 3:
+            # the posting of the query itself holds exactly the matches
+            positions: Sequence[int] = self._postings.get(query, array("I"))
+            self._lastMatch = (query, len(texts), positions)
+            return positions
+        # the rarest trigram is enough, checking the text is cheaper than intersecting more postings
+        candidates: Sequence[int] = min((self._postings.get(trigram, array("I")) for trigram in getTrigrams(query)), 
+                                        key=len)
+        if self._lastMatch is not None and self._lastMatch[0] in query and self._lastMatch[1] == len(texts) \
+           and len(self._lastMatch[2]) < len(candidates):
+            # typing on narrows the last result, nothing new was indexed in between
+            candidates = self._lastMatch[2]
+        positions = [position for position in candidates if query in texts[position]]
+        self._lastMatch = (query, len(texts), positions)
+        return positions
+
+    def _updateRows(self, playList: PlayListSnapshot):
+        self._rows = rows = array("i", [-1]) * len(self._texts)
+        for row, trackId in enumerate(playList.iterTrackIds()):
+            position = self._positions.get(trackId)
+            if position is not None:
+                rows[position] = row
+        # true unless rows were replaced, then matches come out of position order
+        self._rowsAscending = all(previous < row for previous, row in pairwise(row for row in rows if row >= 0))
+        self._rowsIdentical = len(rows) == len(playList) and rows == array("i", range(len(rows)))
+        self._rowsGeneration = playList.generation
+        self._orderedRows.clear()
@@ -0,0 +1,31 @@
+import re
+import unicodedata
+
+from pypinyin import lazy_pinyin, Style
+
+from .types_ import SearchKeys
+
+# separates the fields in a key, and pads the search text, so no match spans two fields
+SEARCH_KEY_SEPARATOR = "\x00"
+
+# characters pypinyin has a reading for
+_HAN_PATTERN = re.compile(r"[㐀-䶿一-鿿豈-﫿]")
+
+def normalizeText(text: str) -> str:
+    """Folds width variants and case, `ＡＢＣ` and `abc` are the same when searching"""
+    return unicodedata.normalize("NFKC", text).casefold()
+
+def getSearchKeys(title: str, artist: str, album: str) -> SearchKeys:
+    """
+    Computed once per track at scan time, typing only ever compares strings.
+    `周杰伦` can be found as `zhoujielun` or `zjl`, other characters are kept
+    as they are in all three keys.
+    """
+    # ID3 joins multiple values with the separator
+    fields = [normalizeText(field).replace(SEARCH_KEY_SEPARATOR, "/") for field in (title, artist, album)]
+    normalized = SEARCH_KEY_SEPARATOR.join(fields)
+    if not _HAN_PATTERN.search(normalized):
+        return SearchKeys(normalized, None, None)
+    pinyin = SEARCH_KEY_SEPARATOR.join("".join(lazy_pinyin(field)) for field in fields)
+    initials = SEARCH_KEY_SEPARATOR.join("".join(lazy_pinyin(field, style=Style.FIRST_LETTER)) for field in fields)
+    return SearchKeys(normalized, pinyin, initials)
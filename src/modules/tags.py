@@ -0,0 +1,134 @@
+import os
+import struct
+from pathlib import Path
+from typing import BinaryIO
+
+from .types_ import CoverRef
+
+# the largest part of a picture frame read to find where the image bytes start
+_PICTURE_HEADER_LIMIT = 4096
+# ID3v2.2 stores a 3 character image format instead of a MIME type
+_ID3V22_IMAGE_FORMATS = {b"JPG": "image/jpeg", b"PNG": "image/png"}
+
+def _syncsafe(data: bytes) -> int:
+    return (data[0] << 21) | (data[1] << 14) | (data[2] << 7) | data[3]
+
+def getId3v2End(file: BinaryIO) -> int:
+    """Returns the offset right after an ID3v2 tag at the start of the file, 0 if there is none"""
+    file.seek(0)
+    header = file.read(10)
+    if len(header) < 10 or header[:3] != b"ID3":
+        return 0
+    footerSize = 10 if header[5] & 0x10 else 0
+    return 10 + _syncsafe(header[6:10]) + footerSize
+
+def findFlacPicture(file: BinaryIO, mediaPath: Path) -> CoverRef | None:
+    """Locates the image bytes of the first PICTURE block without reading them"""
+    try:
+        file.seek(getId3v2End(file))
+        if file.read(4) != b"fLaC":
+            return None
+
+        while True:
+            header = file.read(4)
+            if len(header) < 4:
+                return None
+            isLast = header[0] & 0x80
+            blockType = header[0] & 0x7F
+            blockStart = file.tell()
+
+            if blockType == 6:
+                _, mimeLength = struct.unpack(">II", file.read(8))
+                mimeType = file.read(mimeLength).decode("ascii", "replace")
+                (descriptionLength,) = struct.unpack(">I", file.read(4))
+                # skip the description, width, height, color depth and number of colors
+                file.seek(descriptionLength + 16, os.SEEK_CUR)
+                (dataLength,) = struct.unpack(">I", file.read(4))
+                return CoverRef(mediaPath, file.tell(), dataLength, mimeType)
+
+            if isLast:
+                return None
+            file.seek(blockStart + int.from_bytes(header[1:4], "big"))
+    except (struct.error, OSError):
+        return None
+
+def findId3Picture(file: BinaryIO, mediaPath: Path) -> CoverRef | None:
+    """
+    Locates the image bytes of the first APIC (PIC in ID3v2.2) frame without
+    reading them. Returns None when there is no such frame or when the bytes
+    aren't stored as-is (unsynchronised, compressed or encrypted).
+    """
+    try:
+        file.seek(0)
+        header = file.read(10)
+        if len(header) < 10 or header[:3] != b"ID3":
+            return None
+        majorVersion, flags = header[3], header[5]
+        if majorVersion not in (2, 3, 4) or flags & 0x80:
+            return None
+        tagEnd = 10 + _syncsafe(header[6:10])
+
+        position = 10
+        if flags & 0x40 and majorVersion >= 3:
+            extendedSize = file.read(4)
+            # v2.4 counts the size field itself, v2.3 doesn't
+            position += _syncsafe(extendedSize) if majorVersion == 4 else 4 + int.from_bytes(extendedSize, "big")
+
+        while position < tagEnd:
+            file.seek(position)
+            if majorVersion == 2:
+                frameHeader = file.read(6)
+                frameId, frameSize, frameFlags = frameHeader[:3], int.from_bytes(frameHeader[3:6], "big"), 0
+            else:
+                frameHeader = file.read(10)
+                frameId = frameHeader[:4]
+                frameSize = _syncsafe(frameHeader[4:8]) if majorVersion == 4 else int.from_bytes(frameHeader[4:8], "big")
+                frameFlags = int.from_bytes(frameHeader[8:10], "big")
+            if len(frameHeader) < (6 if majorVersion == 2 else 10) or not frameId.strip(b"\x00"):
+                # reached the padding
+                return None
+            dataStart = position + len(frameHeader)
+
+            if frameId in (b"APIC", b"PIC"):
+                skip = 0
+                if majorVersion == 3:
+                    if frameFlags & 0x00C0:
+                        return None
+                    if frameFlags & 0x0020:
+                        skip += 1
+                elif majorVersion == 4:
+                    if frameFlags & 0x000E:
+                        return None
+                    if frameFlags & 0x0040:
+                        skip += 1
+                    if frameFlags & 0x0001:
+                        skip += 4
+
+                file.seek(dataStart + skip)
+                body = file.read(min(frameSize - skip, _PICTURE_HEADER_LIMIT))
+                encoding = body[0]
+                if majorVersion == 2:
+                    mimeType = _ID3V22_IMAGE_FORMATS.get(body[1:4].upper(), "")
+                    index = 4
+                else:
+                    mimeEnd = body.index(b"\x00", 1)
+                    mimeType = body[1:mimeEnd].decode("latin-1")
+                    index = mimeEnd + 1
+                # skip the picture type
+                index += 1
+                if encoding in (1, 2):
+                    # UTF-16 descriptions end with two zero bytes on a 2-byte boundary
+                    while body[index:index + 2] != b"\x00\x00":
+                        if index + 2 > len(body):
+                            return None
+                        index += 2
+                    index += 2
+                else:
+                    index = body.index(b"\x00", index) + 1
+
+                return CoverRef(mediaPath, dataStart + skip + index, frameSize - skip - index, mimeType)
+
+            position = dataStart + frameSize
+        return None
+    except (ValueError, IndexError, OSError):
+        return None
@@ -1,5 +1,5 @@
 from enum import IntEnum
-from dataclasses import dataclass
+from dataclasses import dataclass, field
 from pathlib import Path
 
 class PlayStatus(IntEnum):
@@ -16,24 +16,104 @@ class PlayerStatus(IntEnum):
     READY = 128
     PREPARING = 256
     
-@dataclass
+class ScanBackend(IntEnum):
+    THREAD = 512
+    PROCESS = 1024
+    
+class ScanPriority(IntEnum):
+    LOW = 2048
+    NORMAL = 4096
+    HIGH = 8192
+    
+@dataclass(slots=True)
+class CoverRef:
+    """Where the bytes of a cover image are, usually inside the audio file itself"""
+    sourcePath: Path
+    offset: int
+    length: int
+    mimeType: str
+    
+@dataclass(slots=True)
+class LyricsRef:
+    """Lyrics stored in the tags of an audio file, only read when they're shown"""
+    sourcePath: Path
+    # the ID3 frame (`SYLT`, `USLT`) or Vorbis comment (`LYRICS`, `UNSYNCEDLYRICS`) holding them
+    tag: str
+    
+@dataclass(slots=True)
+class SearchKeys:
+    """Title, artist and album prepared for searching, see `searchkeys.getSearchKeys`"""
+    normalized: str
+    # None when there is no Chinese in the fields
+    pinyin: str | None
+    initials: str | None
+    
+@dataclass(slots=True)
 class MediaInfo:
     title: str
     artist: str 
     album: str
     lengthMs: int
-    coverPath: Path | None
+    cover: CoverRef | None
     lyricsPath: Path | None
+    searchKeys: SearchKeys | None = None
+    embeddedLyrics: LyricsRef | None = None
 
-@dataclass
+@dataclass(slots=True)
 class MediaItem:
     mediaPath: Path
     mediaInfo: MediaInfo
     
 SUPPORTED_AUDIO_FORMATS = (".mp3", ".flac")
 
+@dataclass(slots=True)
+class LrcWord:
+    """A word of an enhanced LRC line, sung from `timeMs` on"""
+    timeMs: int
+    text: str
+
 @dataclass
 class LrcObject:
     """Used to store a line of lyric"""
     timeMs: int
     text: str
+    # only in enhanced LRC, `text` is the line without the word tags
+    words: list[LrcWord] = field(default_factory=list)
+
+
+@dataclass
+class ScanStats:
+    """Throughput of the last tag extraction, cached tracks are not counted"""
+    parsedFiles: int
+    elapsedS: float
+
+    @property
+    def filesPerSec(self) -> float:
+        return self.parsedFiles / self.elapsedS if self.elapsedS > 0 else 0.0
+
+
+@dataclass
+class ScanProgress:
+    """Live counters of a scan, `etaS` is None until every file has been seen"""
+    filesSeen: int = 0
+    # parsed, loaded from the index or unchanged since the last scan
+    filesProcessed: int = 0
+    filesParsed: int = 0
+    # size of the parsed files, the parsers only read a small part of them
+    parsedBytes: int = 0
+    errors: int = 0
+    elapsedS: float = 0.0
+    etaS: float | None = None
+
+@dataclass
+class LibraryChanges:
+    """Differences between the play list and the files on disk, applied to the play list in place"""
+    removedPaths: list[str] = field(default_factory=list)
+    # new or modified tracks, the play list tells which is which
+    updatedItems: list[MediaItem] = field(default_factory=list)
+    # (size, mtime) of the updated tracks, keyed by path
+    fileStats: dict[str, tuple[int, int]] = field(default_factory=dict)
+    # tracks whose lyrics file was added or removed, keyed by path
+    lyricsPaths: dict[str, Path | None] = field(default_factory=dict)
+    newMusicDirs: list[str] = field(default_factory=list)
+    newLyricsDirs: list[str] = field(default_factory=list)
@@ -0,0 +1,120 @@
+from collections import OrderedDict
+from dataclasses import dataclass
+from itertools import count
+from typing import Iterable
+
+from PySide6.QtCore import QObject, QRunnable, QThreadPool, QSize, Qt, Signal, QBuffer, QByteArray, QIODevice
+from PySide6.QtGui import QImage, QImageReader, QPixmap
+
+from ..types_ import CoverRef
+from ..utils import readCoverBytes, createRoundedImage
+
+def getCoverKey(cover: CoverRef) -> str:
+    return f"{cover.sourcePath}:{cover.offset}"
+
+@dataclass(frozen=True)
+class ThumbnailSpec:
+    """A size the UI shows covers at, `radius` is in pixels of the thumbnail"""
+    width: int
+    height: int
+    radius: float = 0.0
+
+    def size(self) -> QSize:
+        return QSize(self.width, self.height)
+
+class _DecodeTask(QRunnable):
+    def __init__(self, loader: "CoverThumbnailLoader", cover: CoverRef, specs: list[ThumbnailSpec]):
+        super().__init__()
+        self._loader = loader
+        self._cover = cover
+        self._specs = specs
+
+    def run(self):
+        try:
+            data = readCoverBytes(self._cover)
+        except OSError:
+            data = b""
+        buffer = QBuffer()
+        buffer.setData(QByteArray(data))
+        buffer.open(QIODevice.OpenModeFlag.ReadOnly)
+        reader = QImageReader(buffer)
+
+        # decode once at the largest requested size, JPEG can skip most of the work this way
+        largestSize = max((spec.size() for spec in self._specs), key=lambda size: size.width() * size.height())
+        originalSize = reader.size()
+        if originalSize.isValid():
+            reader.setScaledSize(originalSize.scaled(largestSize, Qt.AspectRatioMode.KeepAspectRatio))
+        decoded = reader.read()
+
+        coverKey = getCoverKey(self._cover)
+        for spec in self._specs:
+            image = decoded
+            if not image.isNull():
+                targetSize = image.size().scaled(spec.size(), Qt.AspectRatioMode.KeepAspectRatio)
+                if image.size() != targetSize:
+                    image = image.scaled(targetSize,
+                                         Qt.AspectRatioMode.IgnoreAspectRatio,
+                                         Qt.TransformationMode.SmoothTransformation)
+                image = createRoundedImage(image, spec.radius)
+            # QImage is safe to pass between threads, QPixmap is only created in the UI thread
+            self._loader._imageDecoded.emit(coverKey, spec, image)
+
+class CoverThumbnailLoader(QObject):
+    """
+    Produces cover thumbnails for every `ThumbnailSpec` the UI uses in a
+    background thread pool, and keeps them in a size-capped LRU cache.
+
+    `getThumbnail` never blocks, it returns None and schedules the work when the
+    thumbnail isn't cached yet, `thumbnailReady` is emitted once it is.
+    """
+    thumbnailReady = Signal(str, object)
+    _imageDecoded = Signal(str, object, QImage)
+
+    def __init__(self, maxCacheBytes: int = 32 * 1024 * 1024, parent: QObject | None = None):
+        super().__init__(parent)
+        self._maxCacheBytes = maxCacheBytes
+        self._cacheBytes = 0
+        self._cache: OrderedDict[tuple[str, ThumbnailSpec], QPixmap] = OrderedDict()
+        self._pending: set[tuple[str, ThumbnailSpec]] = set()
+        # later requests are more likely to be on screen, decode them first
+        self._priority = count()
+
+        self._threadPool = QThreadPool(self)
+        self._threadPool.setMaxThreadCount(2)
+        self._imageDecoded.connect(self._onImageDecoded)
+
+    def getThumbnail(self, cover: CoverRef, spec: ThumbnailSpec) -> QPixmap | None:
+        key = (getCoverKey(cover), spec)
+        pixmap = self._cache.get(key)
+        if pixmap is not None:
+            self._cache.move_to_end(key)
+            return pixmap
+        self.prefetch(cover, [spec])
+        return None
+
+    def prefetch(self, cover: CoverRef, specs: Iterable[ThumbnailSpec]):
+        """Schedules the thumbnails of `cover` that are neither cached nor pending, in a single decode"""
+        coverKey = getCoverKey(cover)
+        missingSpecs = [spec for spec in specs
+                        if (coverKey, spec) not in self._cache and (coverKey, spec) not in self._pending]
+        if not missingSpecs:
+            return
+        self._pending.update((coverKey, spec) for spec in missingSpecs)
+        self._threadPool.start(_DecodeTask(self, cover, missingSpecs), next(self._priority))
+
+    def _onImageDecoded(self, coverKey: str, spec: ThumbnailSpec, image: QImage):
+        key = (coverKey, spec)
+        self._pending.discard(key)
+        pixmap = QPixmap.fromImage(image)
+        self._cache[key] = pixmap
+        self._cacheBytes += self._pixmapBytes(pixmap)
+
+        while self._cacheBytes > self._maxCacheBytes and len(self._cache) > 1:
+            _, evicted = self._cache.popitem(last=False)
+            self._cacheBytes -= self._pixmapBytes(evicted)
+
+        self.thumbnailReady.emit(coverKey, spec)
+
+    @staticmethod
+    def _pixmapBytes(pixmap: QPixmap) -> int:
+        return pixmap.width() * pixmap.height() * max(pixmap.depth(), 8) // 8
@@ -1,20 +1,29 @@
-from typing import Literal, Callable
+from typing import Literal, Callable, Sequence
 from dataclasses import dataclass
+from bisect import bisect_left, bisect_right
+from concurrent.futures import Future, ThreadPoolExecutor
+from pathlib import Path
+from array import array
 
 from PySide6.QtWidgets import (QFrame, QWidget, QVBoxLayout, QLabel, QListWidget, 
                                QListWidgetItem, QSpacerItem, QSizePolicy, QHBoxLayout,
                                QPushButton, QSlider, QScrollArea, QLayout, QProgressBar,
-                               QTableWidget, QHeaderView, QAbstractItemView, QStyledItemDelegate,
-                               QStyleOptionViewItem, QStyle, QTextBrowser)
+                               QTableView, QHeaderView, QAbstractItemView, QStyledItemDelegate,
+                               QStyleOptionViewItem, QStyle, QTextBrowser, QLineEdit)
 from PySide6.QtCore import (Qt, QSize, QPropertyAnimation, QTimer, Property, QEasingCurve, 
                             QParallelAnimationGroup, QSequentialAnimationGroup, QEvent, 
-                            QModelIndex, QPersistentModelIndex, QAbstractItemModel)
+                            QModelIndex, QPersistentModelIndex, QAbstractItemModel, QAbstractTableModel, Signal)
 from PySide6.QtGui import (QPixmap, QFont, QResizeEvent, QShowEvent, QColor, QPaintEvent, 
-                           QPainter, QBrush)
+                           QPainter, QBrush, QIcon, QTextCursor, QTextCharFormat, QTextBlockFormat)
 from qtawesome import icon as qtawesomeIcon
 
-from ..utils import createRoundedPixmap, parseLrc, humanizeDuration
-from ..types_ import MediaInfo
+from .thumbnails import CoverThumbnailLoader, ThumbnailSpec, getCoverKey
+from ..utils import createRoundedPixmap, parseLrc, loadLyrics, humanizeDuration
+from ..types_ import MediaInfo, MediaItem, LrcObject, LyricsRef
+from ..playlist import PlayListSnapshot
+
+# covers are rounded like the 640 x 640 default cover with a radius of 30px
+COVER_RADIUS_RATIO = 30 / 640
 
 class IndeterminateProgressBar(QProgressBar):
     def __init__(self, parent: QWidget | None = None, slowCoefficient: float = 1.0):
@@ -25,6 +34,8 @@ class IndeterminateProgressBar(QProgressBar):
         
         self._shortPos = 0
         self._longPos = 0
+        self._determinate = False
+        self._progress = 0.0
         self._barColor = QColor(Qt.GlobalColor.white)
         self._shortBarAni = QPropertyAnimation(self, b'shortPos', self)
         self._longBarAni = QPropertyAnimation(self, b'longPos', self)
@@ -68,6 +79,7 @@ class IndeterminateProgressBar(QProgressBar):
         self.update()
 
     def start(self):
+        self._determinate = False
         self.shortPos = 0 # pyright: ignore[reportAttributeAccessIssue]
         self.longPos = 0 # pyright: ignore[reportAttributeAccessIssue]
         self._aniGroup.start()
@@ -75,10 +87,21 @@ class IndeterminateProgressBar(QProgressBar):
 
     def stop(self):
         self._aniGroup.stop()
+        self._determinate = False
         self.shortPos = 0 # pyright: ignore[reportAttributeAccessIssue]
         self.longPos = 0 # pyright: ignore[reportAttributeAccessIssue]
         self.update()
 
+    def setProgress(self, value: int, maximum: int):
+        """Switch to a determinate bar showing `value / maximum`, `start()` switches back"""
+        if maximum <= 0:
+            return
+        if not self._determinate:
+            self._aniGroup.stop()
+            self._determinate = True
+        self._progress = min(value / maximum, 1.0)
+        self.update()
+
     def setBarColor(self, color: QColor):
         self._barColor = color
 
@@ -88,6 +111,11 @@ class IndeterminateProgressBar(QProgressBar):
 
         painter.setPen(Qt.PenStyle.NoPen)
         painter.setBrush(self._barColor)
+        
+        if self._determinate:
+            r = self.height() / 2
+            painter.drawRoundedRect(0, 0, int(self._progress * self.width()), self.height(), r, r)
+            return
 
         # draw short bar
         x = int((self.shortPos - 0.4) * self.width()) # pyright: ignore[reportOperatorIssue]
@@ -102,83 +130,138 @@ class IndeterminateProgressBar(QProgressBar):
         painter.drawRoundedRect(x, 0, w, self.height(), r, r)
 
 class LyricWidget(QTextBrowser):
+    """
+    Shows the lyrics of a song, the active line is bold and centered.
+
+    The lyrics are laid out once per song, one block per line. A tick only
+    looks up the active line, when it changed the old and the new line swap
+    their format and the view scrolls, the rest of the document is untouched.
+    """
     def __init__(self):
         super().__init__()
         self.setSizePolicy(QSizePolicy.Policy.Preferred, QSizePolicy.Policy.Preferred)
         self.setContextMenuPolicy(Qt.ContextMenuPolicy.NoContextMenu)
         self.verticalScrollBar().setVisible(False)
-        self.setHtml("""
-            <!DOCTYPE html>
-            <html>
-                <head>
-                    <meta charset='utf-8'>
-                    <style>
-                        body {
-                            background-color: rgb(44, 49, 60);
-                            color: #c3ccdf;
-                        }
-                    </style>
-                </head>
-                <body>
-                </body>
-            </html>
-        """)
         
         self.parsedLrcContent = []
         self.getTime: Callable[[], int] = lambda: 0
-        self.displayTextHeader = """
-            <!DOCTYPE html>
-            <html>
-            <head>
-            <meta charset="UTF-8">
-            <style>
-                body {
-                    font-family: HarmonyOS Sans SC;
-                    background-color: rgb(44, 49, 60);
-                    color: #c3ccdf;
-                }
-            </style>
-            </head>
-            <body>
-                <p style='text-align: center;'>
-        """
+        # start of every line, sorted
+        self._timestampsMs = array("q")
+        self._synced = True
+        self._activeLine = -1
+        
+        font = QFont("HarmonyOS Sans SC")
+        font.setPixelSize(16)
+        self._lineFormat = QTextCharFormat()
+        self._lineFormat.setFont(font)
+        self._lineFormat.setForeground(QColor("#c3ccdf"))
+        font = QFont(font)
+        font.setPixelSize(22)
+        font.setBold(True)
+        self._activeLineFormat = QTextCharFormat(self._lineFormat)
+        self._activeLineFormat.setFont(font)
+        self._lineBlockFormat = QTextBlockFormat()
+        self._lineBlockFormat.setAlignment(Qt.AlignmentFlag.AlignHCenter)
+        self._lineBlockFormat.setBottomMargin(16)
+        
+        self._scrollAnimation = QPropertyAnimation(self.verticalScrollBar(), b"value", self)
+        self._scrollAnimation.setDuration(300)
+        self._scrollAnimation.setEasingCurve(QEasingCurve.Type.OutCubic)
         
         self.updateTimer = QTimer()
         self.updateTimer.setInterval(100)
         self.updateTimer.timeout.connect(self.updateDisplay)
         
     def setLrcContent(self, lrcContent: str):
+        self.setLyrics(parseLrc(lrcContent))
+        
+    def setLyrics(self, parsedLrcContent: list[LrcObject]):
+        """Shows lyrics parsed by `parseLrc` or `loadLyrics`, which are sorted already"""
         self.updateTimer.stop()
-        self.parsedLrcContent = parseLrc(lrcContent)
-        self.parsedLrcContent.sort(key = lambda x: x.timeMs)
-        self.updateTimer.start()
+        self.parsedLrcContent = parsedLrcContent
+        self._timestampsMs = array("q", (lrc.timeMs for lrc in self.parsedLrcContent))
+        # plain lyrics have every line at 0, they're shown without highlight
+        self._synced = len(parsedLrcContent) <= 1 or parsedLrcContent[-1].timeMs > 0
+        self._layoutLyrics()
+        if self._synced:
+            self.updateTimer.start()
         
     def setGetTimeFunc(self, func: Callable[[], int]):
         self.getTime = func
         
-    def updateDisplay(self):
-        nowTimeMs = self.getTime()
-        
-        displayText = self.displayTextHeader
-        parsedLrcContent = self.parsedLrcContent
-        
-        if len(parsedLrcContent) == 1:
-            displayText += ('<b style="font-size: 22px">' + parsedLrcContent[0].text + '</b>')
+    def _layoutLyrics(self):
+        self._scrollAnimation.stop()
+        self._activeLine = -1
+        document = self.document()
+        document.clear()
+        self._updateDocumentMargin()
+        cursor = QTextCursor(document)
+        cursor.setBlockFormat(self._lineBlockFormat)
+        for i, lrc in enumerate(self.parsedLrcContent):
+            if i:
+                cursor.insertBlock(self._lineBlockFormat)
+            cursor.insertText(lrc.text, self._lineFormat)
+        self.verticalScrollBar().setValue(0)
+        self.updateDisplay()
+        
+    def _updateDocumentMargin(self):
+        # the first and the last line can be scrolled to the middle too
+        frameFormat = self.document().rootFrame().frameFormat()
+        margin = self.viewport().height() / 2 # pyright: ignore[reportOptionalMemberAccess]
+        if frameFormat.topMargin() != margin:
+            frameFormat.setTopMargin(margin)
+            frameFormat.setBottomMargin(margin)
+            self.document().rootFrame().setFrameFormat(frameFormat)
+        
+    def _setLineFormat(self, line: int, charFormat: QTextCharFormat):
+        block = self.document().findBlockByNumber(line)
+        cursor = QTextCursor(block)
+        cursor.movePosition(QTextCursor.MoveOperation.EndOfBlock, QTextCursor.MoveMode.KeepAnchor)
+        cursor.setCharFormat(charFormat)
+        
+    def _scrollToActiveLine(self, animated: bool = True):
+        if self._activeLine < 0:
+            value = 0
         else:
-            for i, lrc in enumerate(parsedLrcContent):
-                if lrc.timeMs >= nowTimeMs:
-                    parsedLrcContent = parsedLrcContent[i-1:]
-                    break
-                
-            displayText += ('<br/><b style="font-size: 22px">' + parsedLrcContent[0].text + '</b>')
-                
-            for lrc in parsedLrcContent[1:]:
-                displayText += ('<br/><br/><span style="font-size: 16px">' + lrc.text + '</span>')
-            
-        displayText += "</p></body></html>"
+            block = self.document().findBlockByNumber(self._activeLine)
+            rect = self.document().documentLayout().blockBoundingRect(block) # pyright: ignore[reportOptionalMemberAccess]
+            value = round(rect.center().y() - self.viewport().height() / 2) # pyright: ignore[reportOptionalMemberAccess]
+        self._scrollAnimation.stop()
+        if not animated:
+            self.verticalScrollBar().setValue(value)
+            return
+        self._scrollAnimation.setStartValue(self.verticalScrollBar().value())
+        self._scrollAnimation.setEndValue(value)
+        self._scrollAnimation.start()
+        
+    def _findActiveLine(self, nowTimeMs: int) -> int:
+        """The last line that started by `nowTimeMs`, -1 before the first one"""
+        timestampsMs = self._timestampsMs
+        # playing on stays on the active line or reaches the next one, only a seek needs a search
+        for line in (self._activeLine, self._activeLine + 1):
+            if line < len(timestampsMs) and (line < 0 or timestampsMs[line] <= nowTimeMs) and \
+               (line + 1 == len(timestampsMs) or nowTimeMs < timestampsMs[line + 1]):
+                return line
+        return bisect_right(timestampsMs, nowTimeMs) - 1
         
-        self.setHtml(displayText)
-        self.update()
+    def updateDisplay(self):
+        if not self._synced:
+            return
+        activeLine = self._findActiveLine(self.getTime())
+        if activeLine == self._activeLine:
+            return
+        
+        if self._activeLine >= 0:
+            self._setLineFormat(self._activeLine, self._lineFormat)
+        if activeLine >= 0:
+            self._setLineFormat(activeLine, self._activeLineFormat)
+        self._activeLine = activeLine
+        self._scrollToActiveLine()
+        
+    def resizeEvent(self, e: QResizeEvent):
+        super().resizeEvent(e)
+        self._updateDocumentMargin()
+        self._scrollToActiveLine(animated=False)
 
 class MarqueeLabel(QScrollArea):
     def __init__(self):
@@ -508,11 +591,15 @@ class PlayStateBar(QFrame):
     
     Maxinum size: Infinite x 55, minimum size: 300 x 55 (hide details)
     """
-    def __init__(self) -> None:
+    def __init__(self, thumbnailLoader: CoverThumbnailLoader) -> None:
         super().__init__()
         self._layout = QHBoxLayout(self)
         self._isShowingDetails = True
         self._playerSetPos = None
+        self._thumbnailLoader = thumbnailLoader
+        self._thumbnailLoader.thumbnailReady.connect(self._onThumbnailReady)
+        self._currentCover = None
+        self.coverThumbnailSpec = ThumbnailSpec(95, 95, 95 * COVER_RADIUS_RATIO)
         self.setLayout(self._layout)
         self.setupWidgets()
         self.setObjectName("PlayStateBar")
@@ -535,7 +622,8 @@ class PlayStateBar(QFrame):
             border: 1px solid #20242c; 
             border-radius: 5px; color: #848fa3;
         """)
-        self.musicCover.setPixmap(createRoundedPixmap(QPixmap("res/imgs/defaultCover.png"), 30))
+        self._defaultCover = createRoundedPixmap("res/imgs/defaultCover.png", 30)
+        self.musicCover.setPixmap(self._defaultCover)
         self.musicCover.setScaledContents(True)
         
         self.rightLayout = QVBoxLayout()
@@ -712,8 +800,22 @@ class PlayStateBar(QFrame):
         self.setMinimumHeight(55)
         self._isShowingDetails = False
         
+    def _onThumbnailReady(self, coverKey: str, spec: ThumbnailSpec):
+        if self._currentCover and spec == self.coverThumbnailSpec and coverKey == getCoverKey(self._currentCover):
+            self._showCover(self._thumbnailLoader.getThumbnail(self._currentCover, spec))
+            
+    def _showCover(self, thumbnail: QPixmap | None):
+        if thumbnail is None or thumbnail.isNull():
+            self.musicCover.setPixmap(self._defaultCover)
+        else:
+            self.musicCover.setPixmap(thumbnail)
+        
     def setMediaInfo(self, musicInfo: MediaInfo):
-        self.musicCover.setPixmap(createRoundedPixmap(QPixmap(str(musicInfo.coverPath)), 30))
+        self._currentCover = musicInfo.cover
+        thumbnail = None
+        if musicInfo.cover:
+            thumbnail = self._thumbnailLoader.getThumbnail(musicInfo.cover, self.coverThumbnailSpec)
+        self._showCover(thumbnail)
         self.musicTitle.setText(musicInfo.title)
         self.musicArtist.setText(musicInfo.artist)
         self.musicPlayProgress.setValue(0)
@@ -765,13 +867,14 @@ class Pages(object):
                     oldRow = self._hoveredRow
                     self._hoveredRow = row
                     if self.parent():
-                        table: QTableWidget = self.parent() # pyright: ignore[reportAssignmentType]
-                        if oldRow >= 0 and oldRow < table.rowCount():
-                            for col in range(table.columnCount()):
-                                table.update(table.model().index(oldRow, col))
-                        if row >= 0 and row < table.rowCount():
-                            for col in range(table.columnCount()):
-                                table.update(table.model().index(row, col))
+                        table: QTableView = self.parent() # pyright: ignore[reportAssignmentType]
+                        model = table.model()
+                        if oldRow >= 0 and oldRow < model.rowCount():
+                            for col in range(model.columnCount()):
+                                table.update(model.index(oldRow, col))
+                        if row >= 0 and row < model.rowCount():
+                            for col in range(model.columnCount()):
+                                table.update(model.index(row, col))
             
             def paint(self, 
                       painter: QPainter, 
@@ -799,11 +902,215 @@ class Pages(object):
                 
                 return super().editorEvent(event, model, option, index)
             
-        def __init__(self) -> None:
+        class PlayListModel(QAbstractTableModel):
+            """
+            Read-only model of a play list snapshot, display data is only built when 
+            the view asks for it, i.e. for the visible rows.
+            
+            A row map narrows the model to some rows of the snapshot and/or reorders 
+            them, view rows are then mapped through it, `getPlayListRow` gives the 
+            row in the snapshot. Sorting only asks for a new map, see `sortChanged`.
+            """
+            headers = ["标题", "歌手", "专辑", "时长"]
+            
+            sortChanged = Signal()
+            
+            def __init__(self, iconSize: QSize, thumbnailLoader: CoverThumbnailLoader, parent=None):
+                super().__init__(parent)
+                self._playList = PlayListSnapshot()
+                # snapshot row of every view row, None when showing every row in play list order
+                self._rowMap: Sequence[int] | None = None
+                self._sortColumn = -1
+                self._sortOrder = Qt.SortOrder.AscendingOrder
+                self._defaultCover = self._createIcon(QPixmap("res/imgs/defaultCover.png").scaled(
+                    iconSize, Qt.AspectRatioMode.KeepAspectRatio, Qt.TransformationMode.SmoothTransformation))
+                
+                self._iconSpec = ThumbnailSpec(iconSize.width(), iconSize.height())
+                self._thumbnailLoader = thumbnailLoader
+                self._thumbnailLoader.thumbnailReady.connect(self._onThumbnailReady)
+                # thumbnails tend to arrive in bursts while scrolling, repaint once per burst
+                self._repaintTimer = QTimer(self)
+                self._repaintTimer.setSingleShot(True)
+                self._repaintTimer.setInterval(30)
+                self._repaintTimer.timeout.connect(self._repaintCovers)
+                
+            @staticmethod
+            def _createIcon(pixmap: QPixmap) -> QIcon:
+                # the same pixmap for selected rows, otherwise the style tints it
+                icon = QIcon()
+                icon.addPixmap(pixmap, QIcon.Mode.Normal, QIcon.State.Off)
+                icon.addPixmap(pixmap, QIcon.Mode.Selected, QIcon.State.Off)
+                return icon
+                
+            def rowCount(self, parent: QModelIndex | QPersistentModelIndex = QModelIndex()) -> int:
+                if parent.isValid():
+                    return 0
+                return len(self._playList) if self._rowMap is None else len(self._rowMap)
+            
+            def columnCount(self, parent: QModelIndex | QPersistentModelIndex = QModelIndex()) -> int:
+                return 0 if parent.isValid() else len(self.headers)
+            
+            def headerData(self, section: int, orientation: Qt.Orientation, role: int = Qt.ItemDataRole.DisplayRole):
+                if orientation == Qt.Orientation.Horizontal and role == Qt.ItemDataRole.DisplayRole:
+                    return self.headers[section]
+                return None
+            
+            def data(self, index: QModelIndex | QPersistentModelIndex, role: int = Qt.ItemDataRole.DisplayRole):
+                if not index.isValid():
+                    return None
+                row = self.getPlayListRow(index.row())
+                column = index.column()
+                
+                # single fields straight from the columns, no MediaItem is created
+                if role == Qt.ItemDataRole.DisplayRole or role == Qt.ItemDataRole.ToolTipRole:
+                    if column == 0: return self._playList.getTitle(row)
+                    elif column == 1: return self._playList.getArtist(row)
+                    elif column == 2: return self._playList.getAlbum(row)
+                    elif column == 3 and role == Qt.ItemDataRole.DisplayRole: 
+                        return humanizeDuration(self._playList.getLengthMs(row))
+                elif role == Qt.ItemDataRole.DecorationRole and column == 0:
+                    cover = self._playList.getCover(row)
+                    if cover:
+                        thumbnail = self._thumbnailLoader.getThumbnail(cover, self._iconSpec)
+                        if thumbnail is not None and not thumbnail.isNull():
+                            return self._createIcon(thumbnail)
+                    return self._defaultCover
+                return None
+            
+            def _onThumbnailReady(self, coverKey: str, spec: ThumbnailSpec):
+                if spec == self._iconSpec and not self._repaintTimer.isActive():
+                    self._repaintTimer.start()
+                    
+            def _repaintCovers(self):
+                if self.rowCount():
+                    # the view only repaints the rows that are visible
+                    self.dataChanged.emit(self.index(0, 0), 
+                                          self.index(self.rowCount() - 1, 0), 
+                                          [Qt.ItemDataRole.DecorationRole])
+            
+            def appendItems(self, playList: PlayListSnapshot, firstRow: int):
+                """`playList` is the current one with the rows from `firstRow` on appended"""
+                # a mapped model shows new rows once its row map is updated
+                if len(playList) <= firstRow or self._rowMap is not None:
+                    self._playList = playList
+                    return
+                self.beginInsertRows(QModelIndex(), firstRow, len(playList) - 1)
+                self._playList = playList
+                self.endInsertRows()
+                
+            def replaceItems(self, playList: PlayListSnapshot, rows: list[int]):
+                self._playList = playList
+                if self._rowMap is not None:
+                    # the rows may be anywhere in the map, the view only repaints the visible ones
+                    if rows and self._rowMap:
+                        self.dataChanged.emit(self.index(0, 0), 
+                                              self.index(len(self._rowMap) - 1, len(self.headers) - 1))
+                    return
+                for row in rows:
+                    self.dataChanged.emit(self.index(row, 0), self.index(row, len(self.headers) - 1))
+                    
+            def removeItems(self, playList: PlayListSnapshot, rows: list[int]):
+                """`playList` is the current one without `rows`, which are sorted"""
+                if self._rowMap is not None:
+                    self._removeMappedItems(playList, rows)
+                    return
+                if rows and rows[-1] - rows[0] == len(rows) - 1:
+                    self.beginRemoveRows(QModelIndex(), rows[0], rows[-1])
+                    self._playList = playList
+                    self.endRemoveRows()
+                    return
+                
+                # scattered rows at once, moving the persistent indexes keeps selection and current row
+                self.layoutAboutToBeChanged.emit()
+                oldIndexes = self.persistentIndexList()
+                newIndexes: list[QModelIndex] = []
+                for index in oldIndexes:
+                    removedBefore = bisect_left(rows, index.row())
+                    if removedBefore < len(rows) and rows[removedBefore] == index.row():
+                        newIndexes.append(QModelIndex())
+                    else:
+                        newIndexes.append(self.createIndex(index.row() - removedBefore, index.column()))
+                self._playList = playList
+                self.changePersistentIndexList(oldIndexes, newIndexes)
+                self.layoutChanged.emit()
+                
+            def _removeMappedItems(self, playList: PlayListSnapshot, rows: list[int]):
+                # view rows of the removed rows disappear, the others keep their order but map to shifted rows
+                newViewRows: list[int | None] = []
+                rowMap: list[int] = []
+                for row in self._rowMap or ():
+                    removedBefore = bisect_left(rows, row)
+                    if removedBefore < len(rows) and rows[removedBefore] == row:
+                        newViewRows.append(None)
+                    else:
+                        newViewRows.append(len(rowMap))
+                        rowMap.append(row - removedBefore)
+                
+                self.layoutAboutToBeChanged.emit()
+                oldIndexes = self.persistentIndexList()
+                newIndexes: list[QModelIndex] = []
+                for index in oldIndexes:
+                    viewRow = newViewRows[index.row()]
+                    newIndexes.append(QModelIndex() if viewRow is None else self.createIndex(viewRow, index.column()))
+                self._playList = playList
+                self._rowMap = rowMap
+                self.changePersistentIndexList(oldIndexes, newIndexes)
+                self.layoutChanged.emit()
+                
+            def setRowMap(self, rows: Sequence[int] | None):
+                """Shows `rows` of the current snapshot in that order, or every row in play list order if None"""
+                if (len(self._playList) if rows is None else len(rows)) != self.rowCount():
+                    self.beginResetModel()
+                    self._rowMap = rows
+                    self.endResetModel()
+                    return
+                
+                # the same rows in another order, moving the persistent indexes keeps selection and current row
+                self.layoutAboutToBeChanged.emit([], QAbstractItemModel.LayoutChangeHint.VerticalSortHint)
+                oldIndexes = self.persistentIndexList()
+                newIndexes: list[QModelIndex] = []
+                if oldIndexes:
+                    newViewRows = {row: viewRow for viewRow, row in enumerate(rows)} if rows is not None else None
+                    for index in oldIndexes:
+                        row = self.getPlayListRow(index.row())
+                        viewRow = row if newViewRows is None else newViewRows.get(row)
+                        newIndexes.append(QModelIndex() if viewRow is None else self.createIndex(viewRow, index.column()))
+                self._rowMap = rows
+                self.changePersistentIndexList(oldIndexes, newIndexes)
+                self.layoutChanged.emit([], QAbstractItemModel.LayoutChangeHint.VerticalSortHint)
+                
+            def hasRowMap(self) -> bool:
+                return self._rowMap is not None
+            
+            def sort(self, column: int, order: Qt.SortOrder = Qt.SortOrder.AscendingOrder):
+                self._sortColumn = column
+                self._sortOrder = order
+                self.sortChanged.emit()
+                
+            def getSortColumn(self) -> int:
+                return self._sortColumn
+            
+            def getSortOrder(self) -> Qt.SortOrder:
+                return self._sortOrder
+                
+            def getPlayListRow(self, viewRow: int) -> int:
+                return viewRow if self._rowMap is None else self._rowMap[viewRow]
+            
+            def getItem(self, row: int) -> MediaItem:
+                return self._playList[self.getPlayListRow(row)]
+            
+            def getPlayList(self) -> PlayListSnapshot:
+                return self._playList
+            
+            def getGeneration(self) -> int:
+                return self._playList.generation
+            
+        def __init__(self, thumbnailLoader: CoverThumbnailLoader) -> None:
             super().__init__()
             self._layout = QVBoxLayout()
             self._layout.setContentsMargins(0, 3, 0, 5)
             self._layout.setSpacing(4)
+            self._thumbnailLoader = thumbnailLoader
             
             self.setLayout(self._layout)
             self.setMouseTracking(True)
@@ -834,23 +1141,47 @@ class Pages(object):
             self.syncButton.setStyleSheet("background-color: transparent")
             self.syncButton.setIcon(self.SyncButtonIcon.syncing)
             
+            self.searchBox = QLineEdit()
+            self.searchBox.setPlaceholderText("搜索标题、歌手、专辑")
+            self.searchBox.setClearButtonEnabled(True)
+            self.searchBox.setMaximumWidth(240)
+            _font = self.font()
+            _font.setPointSize(10)
+            self.searchBox.setFont(_font)
+            self.searchBox.setStyleSheet("""
+                QLineEdit{
+                    color: #c3ccdf;
+                    background-color: transparent;
+                    border: 1px solid rgb(59, 64, 74);
+                    border-radius: 5px;
+                    padding: 2px 5px;
+                }""")
+            
             topLayout.addWidget(self.songCount)
+            topLayout.addWidget(self.searchBox)
             topLayout.addWidget(self.syncStatus)
             topLayout.addWidget(self.syncButton)
             
             self.progressBar = IndeterminateProgressBar(slowCoefficient=1.2)
             self.progressBar.setBarColor(QColor(93, 152, 204))
             
-            self.playList = QTableWidget()
-            self.playList.setColumnCount(4)
+            self.playList = QTableView()
+            # icons are decoded at exactly this size, keep the style's default one
+            iconExtent = self.playList.style().pixelMetric(QStyle.PixelMetric.PM_SmallIconSize)
+            self.playList.setIconSize(QSize(iconExtent, iconExtent))
+            self.playListModel = self.PlayListModel(self.playList.iconSize(), self._thumbnailLoader)
+            self.playList.setModel(self.playListModel)
             self.playList.setVerticalScrollMode(QAbstractItemView.ScrollMode.ScrollPerPixel)
-            self.playList.setHorizontalHeaderLabels(["标题", "歌手", "专辑", "时长"])
             self.playList.verticalHeader().setVisible(False)
             self.playList.verticalScrollBar().setSingleStep(15)
             self.playList.horizontalHeader().setSectionResizeMode(QHeaderView.ResizeMode.Fixed)
             self.playList.setEditTriggers(QAbstractItemView.EditTrigger.NoEditTriggers)
-            self.playList.setSelectionBehavior(QTableWidget.SelectionBehavior.SelectRows)
+            self.playList.setSelectionBehavior(QAbstractItemView.SelectionBehavior.SelectRows)
             self.playList.horizontalHeader().setHighlightSections(False)
+            # unsorted until a header is clicked, a third click goes back to the play list order
+            self.playList.horizontalHeader().setSortIndicator(-1, Qt.SortOrder.AscendingOrder)
+            self.playList.horizontalHeader().setSortIndicatorClearable(True)
+            self.playList.setSortingEnabled(True)
             self.playList.verticalHeader().setHighlightSections(False)
             self.playList.setMouseTracking(True)
             self.playList.setItemDelegate(self.HoverHighlightDelegate(self.playList))
@@ -858,22 +1189,22 @@ class Pages(object):
             _font.setPointSize(10)
             self.playList.setFont(_font)
             self.playList.setStyleSheet("""
-                QTableWidget{ 
+                QTableView{ 
                     border: 1px solid rgb(59, 64, 74);
                     border-radius: 5px;
                     outline: none;
                     gridline-color: rgb(59, 64, 74);
                 }
                 
-                QTableWidget::item{ 
+                QTableView::item{ 
                     padding: 10px 5px;
                 }
                 
-                QTableWidget::item:hover{
+                QTableView::item:hover{
                     background-color: rgb(56, 61, 71);
                 }
                 
-                QTableWidget::item:selected{
+                QTableView::item:selected{
                     border: none;
                     border-radius: none;
                     background-color: rgb(56, 61, 71);
@@ -930,9 +1261,17 @@ class Pages(object):
             return super().resizeEvent(event)
         
     class MusicDetailPage(QFrame):
-        def __init__(self) -> None:
+        _MAX_PRELOADED_LYRICS = 2
+        
+        def __init__(self, thumbnailLoader: CoverThumbnailLoader) -> None:
             super().__init__()
             self._layout = QHBoxLayout()
+            self._thumbnailLoader = thumbnailLoader
+            self._thumbnailLoader.thumbnailReady.connect(self._onThumbnailReady)
+            self._currentCover = None
+            self._lyricsLoader = ThreadPoolExecutor(max_workers=1, thread_name_prefix="lyricsLoader")
+            # the newest last, a song is announced as upcoming before the one starting now is shown
+            self._preloadedLyrics: list[tuple[Path | LyricsRef, Future[list[LrcObject]]]] = []
             
             self.setLayout(self._layout)
             self.setMouseTracking(True)
@@ -943,10 +1282,14 @@ class Pages(object):
             
             # TODO: Cover Size add to config
             self._coverSize = QSize(250, 250)
+            self.coverThumbnailSpec = ThumbnailSpec(self._coverSize.width(), 
+                                                    self._coverSize.height(), 
+                                                    self._coverSize.width() * COVER_RADIUS_RATIO)
+            self._defaultCover = createRoundedPixmap("res/imgs/defaultCover.png", 30, self._coverSize)
             self.cover = QLabel()
             self.cover.setAlignment(Qt.AlignmentFlag.AlignCenter | Qt.AlignmentFlag.AlignVCenter)
             self.cover.setSizePolicy(QSizePolicy.Policy.Preferred, QSizePolicy.Policy.Preferred)
-            self.cover.setPixmap(createRoundedPixmap(QPixmap("res/imgs/defaultCover.png"), 30, self._coverSize))
+            self.cover.setPixmap(self._defaultCover)
             
             self.title = QLabel("Title")
             self.title.setSizePolicy(QSizePolicy.Policy.Preferred, QSizePolicy.Policy.Preferred)
@@ -991,17 +1334,52 @@ class Pages(object):
             self._layout.addWidget(self.lyricDisplayer)
             self._layout.setStretchFactor(self.lyricDisplayer, 1)
             
+        @staticmethod
+        def getLyricsSource(info: MediaInfo) -> Path | LyricsRef | None:
+            # a lyrics file is usually synced, embedded lyrics often aren't
+            return info.lyricsPath or info.embeddedLyrics
+            
+        def preloadLyrics(self, info: MediaInfo):
+            """Loads the lyrics of the upcoming song in the background, `setMediaInfo` then only takes them"""
+            lyricsSource = self.getLyricsSource(info)
+            if not lyricsSource or any(source == lyricsSource for source, _ in self._preloadedLyrics):
+                return
+            self._preloadedLyrics.append((lyricsSource, self._lyricsLoader.submit(loadLyrics, lyricsSource)))
+            # songs announced but never played
+            del self._preloadedLyrics[:-self._MAX_PRELOADED_LYRICS]
+                
+        def _takeLyrics(self, lyricsSource: Path | LyricsRef) -> list[LrcObject]:
+            for i, (source, lyrics) in enumerate(self._preloadedLyrics):
+                if source == lyricsSource:
+                    del self._preloadedLyrics[i]
+                    # usually done long ago, waiting for it is still faster than starting over
+                    return lyrics.result()
+            return loadLyrics(lyricsSource)
+            
+        def _onThumbnailReady(self, coverKey: str, spec: ThumbnailSpec):
+            if self._currentCover and spec == self.coverThumbnailSpec and coverKey == getCoverKey(self._currentCover):
+                self._showCover(self._thumbnailLoader.getThumbnail(self._currentCover, spec))
+                
+        def _showCover(self, thumbnail: QPixmap | None):
+            if thumbnail is None or thumbnail.isNull():
+                self.cover.setPixmap(self._defaultCover)
+            else:
+                self.cover.setPixmap(thumbnail)
+            
         def setMediaInfo(self, info: MediaInfo):
             self.title.setText(info.title)
             self.album.setText(info.album)
             self.artist.setText(info.artist)
-            if info.coverPath:
-                self.cover.setPixmap(createRoundedPixmap(QPixmap(info.coverPath), 30, self._coverSize))
-            else:
-                self.cover.setPixmap(createRoundedPixmap(QPixmap("res/imgs/defaultCover.png"), 30, self._coverSize))
-            if info.lyricsPath:
-                with open(info.lyricsPath, "r", encoding="utf-8") as file:
-                    self.lyricDisplayer.setLrcContent(file.read())
+            self._currentCover = info.cover
+            thumbnail = None
+            if info.cover:
+                thumbnail = self._thumbnailLoader.getThumbnail(info.cover, self.coverThumbnailSpec)
+            self._showCover(thumbnail)
+            lyricsSource = self.getLyricsSource(info)
+            # embedded lyrics may have been removed since the scan
+            lyrics = self._takeLyrics(lyricsSource) if lyricsSource else []
+            if lyrics:
+                self.lyricDisplayer.setLyrics(lyrics)
             else:
                 self.lyricDisplayer.setLrcContent("[00:00.000] 暂无歌词")
 
@@ -1,12 +1,17 @@
+from typing import Sequence
+
 from PySide6.QtWidgets import (QMainWindow, QVBoxLayout, QWidget, QHBoxLayout, 
-                               QStackedLayout, QFrame, QListWidgetItem, QTableWidgetItem)
+                               QStackedLayout, QFrame, QListWidgetItem)
 from PySide6.QtCore import Qt, QRect, QPoint
-from PySide6.QtGui import QMouseEvent, QIcon
+from PySide6.QtGui import QMouseEvent
 from qtawesome import icon as qtawesomeIcon
 
 from .widgets import SideMenuBar, TitleBar, PlayStateBar, Pages
+from .thumbnails import CoverThumbnailLoader
 from ..utils import getCursorDirection, humanizeDuration
-from ..types_ import MediaItem, MediaInfo
+from ..types_ import MediaInfo, ScanProgress
+from ..playlist import PlayListSnapshot
+from ..search import SearchIndex, SearchQuery
 
 class MainWindow(QMainWindow):
     def __init__(self):
@@ -45,6 +50,10 @@ class MainWindow(QMainWindow):
         self.setupSignals()
         
     def setupWidgets(self):
+        # shared by every widget showing covers, so a cover is only decoded once per size
+        self.thumbnailLoader = CoverThumbnailLoader(parent=self)
+        self.searchIndex = SearchIndex(parent=self)
+        
         self._contextLayout = QHBoxLayout()
         self._contextLayout.setContentsMargins(0, 0, 0, 0)
         
@@ -71,8 +80,8 @@ class MainWindow(QMainWindow):
         self.pagesFrame.setMouseTracking(True)
         
         self.homePage = Pages.HomePage()
-        self.playListPage = Pages.PlayListPage()
-        self.musicDetailPage = Pages.MusicDetailPage()
+        self.playListPage = Pages.PlayListPage(self.thumbnailLoader)
+        self.musicDetailPage = Pages.MusicDetailPage(self.thumbnailLoader)
         self.aboutPage = Pages.AboutPage()
         self.settingsPage = Pages.SettingsPage()
         
@@ -82,7 +91,7 @@ class MainWindow(QMainWindow):
         self._pagesLayout.addWidget(self.aboutPage)
         self._pagesLayout.addWidget(self.settingsPage)
         
-        self.playStateBar = PlayStateBar()
+        self.playStateBar = PlayStateBar(self.thumbnailLoader)
         self.playStateBar.setStyleSheet("background-color: #343b48; border-radius: 5px;")
         self.playStateBar.setMouseTracking(True)
         
@@ -99,6 +108,9 @@ class MainWindow(QMainWindow):
         self.titleBar.maximizeButton.clicked.connect(self.toggleMaximize)
         self.titleBar.closeButton.clicked.connect(self.close)
         self.sideMenuBar.menuList.itemClicked.connect(self.onMenuClicked)
+        self.playListPage.searchBox.textChanged.connect(self.onSearchTextChanged)
+        self.playListPage.playListModel.sortChanged.connect(self.updatePlayListView)
+        self.searchIndex.resultsReady.connect(self.onSearchResults)
         
     def toggleMaximize(self):
         if self.isMaximized():
@@ -247,42 +259,91 @@ class MainWindow(QMainWindow):
             self._pagesLayout.setCurrentIndex(4)
             self.playStateBar.showDetails()
             
-    def onPlayerReady(self, playList: list[MediaItem]):
+    def onPlayerReady(self, playList: PlayListSnapshot):
         self.playListPage.songCount.setText(f"当前列表中有 {len(playList)} 首歌曲")
         self.playListPage.progressBar.stop()
         self.playListPage.syncStatus.setText("播放列表已更新完成")
         self.playListPage.syncButton.setIcon(self.playListPage.SyncButtonIcon.finish)
         
-        self.playListPage.playList.setRowCount(len(playList))
-        
-        for index, item in enumerate(playList):
-            if item.mediaInfo.coverPath and item.mediaInfo.coverPath.exists():
-                cover = QIcon()
-                cover.addFile(str(item.mediaInfo.coverPath), mode=QIcon.Mode.Normal, state=QIcon.State.Off)
-                cover.addFile(str(item.mediaInfo.coverPath), mode=QIcon.Mode.Selected, state=QIcon.State.Off)
-                tableItem = QTableWidgetItem(item.mediaInfo.title)
-                tableItem.setToolTip(item.mediaInfo.title)
-                tableItem.setIcon(QIcon(cover))
-                self.playListPage.playList.setItem(index, 0, tableItem)
-            else:
-                cover = QIcon()
-                cover.addFile("res/imgs/ddefaultCover.png", mode=QIcon.Mode.Normal, state=QIcon.State.Off)
-                cover.addFile("res/imgs/ddefaultCover.png", mode=QIcon.Mode.Selected, state=QIcon.State.Off)
-                tableItem = QTableWidgetItem(item.mediaInfo.title)
-                tableItem.setToolTip(item.mediaInfo.title)
-                tableItem.setIcon(QIcon(cover))
-                self.playListPage.playList.setItem(index, 0, tableItem)
-            
-            tableItem = QTableWidgetItem(item.mediaInfo.artist)
-            tableItem.setToolTip(item.mediaInfo.artist)
-            self.playListPage.playList.setItem(index, 1, tableItem)
+    def onPlayListSyncStarted(self):
+        self.playListPage.progressBar.start()
+        self.playListPage.syncStatus.setText("播放列表更新中")
+        self.playListPage.syncButton.setIcon(self.playListPage.SyncButtonIcon.syncing)
+        
+    def onScanProgress(self, progress: ScanProgress):
+        self.playListPage.progressBar.setProgress(progress.filesProcessed, progress.filesSeen)
+        status = f"播放列表更新中 ({progress.filesProcessed}/{progress.filesSeen})"
+        if progress.etaS is not None:
+            status += f" 剩余 {humanizeDuration(round(progress.etaS * 1000))}"
+        self.playListPage.syncStatus.setText(status)
+        
+    def onScanCancelled(self):
+        self.playListPage.progressBar.stop()
+        self.playListPage.syncStatus.setText("播放列表更新已取消")
+        self.playListPage.syncButton.setIcon(self.playListPage.SyncButtonIcon.finish)
+        
+    def onScanFailed(self, error: Exception):
+        self.playListPage.progressBar.stop()
+        self.playListPage.syncStatus.setText(f"播放列表更新失败: {error}")
+        self.playListPage.syncButton.setIcon(self.playListPage.SyncButtonIcon.finish)
             
-            tableItem = QTableWidgetItem(item.mediaInfo.album)
-            tableItem.setToolTip(item.mediaInfo.album)
-            self.playListPage.playList.setItem(index, 2, tableItem)
-
-            self.playListPage.playList.setItem(index, 3, QTableWidgetItem(humanizeDuration(item.mediaInfo.lengthMs)))
+    def appendPlayListItems(self, playList: PlayListSnapshot, firstRow: int):
+        self.playListPage.playListModel.appendItems(playList, firstRow)
+        self.playListPage.songCount.setText(f"当前列表中有 {len(playList)} 首歌曲")
+        self.searchIndex.addTracks(playList, range(firstRow, len(playList)))
+        self._refreshSearch()
             
+    def updatePlayListItems(self, playList: PlayListSnapshot, rows: list[int]):
+        self.playListPage.playListModel.replaceItems(playList, rows)
+        self.searchIndex.addTracks(playList, rows)
+        self._refreshSearch()
+        
+    def removePlayListItems(self, playList: PlayListSnapshot, rows: list[int]):
+        self.playListPage.playListModel.removeItems(playList, rows)
+        self.playListPage.songCount.setText(f"当前列表中有 {len(playList)} 首歌曲")
+        
+    def onSearchTextChanged(self, text: str):
+        self.updatePlayListView()
+        
+    def _getSearchQuery(self) -> SearchQuery:
+        model = self.playListPage.playListModel
+        return SearchQuery(self.playListPage.searchBox.text(), model.getSortColumn(), 
+                           model.getSortOrder() == Qt.SortOrder.DescendingOrder)
+        
+    def updatePlayListView(self):
+        """Asks the search index for the rows matching the search box, in the order of the sorted column"""
+        query = self._getSearchQuery()
+        if not query.text.strip() and query.sortColumn < 0:
+            # results of earlier queries are dropped, they don't match the query any more
+            self.playListPage.playListModel.setRowMap(None)
+            return
+        self.searchIndex.search(query, self.playListPage.playListModel.getPlayList())
+        
+    def _refreshSearch(self):
+        # changed rows may match the query or not any more, or move in the sort order
+        if self.playListPage.playListModel.hasRowMap():
+            self.updatePlayListView()
+        
+    def onSearchResults(self, query: SearchQuery, playList: PlayListSnapshot, rows: Sequence[int] | None):
+        if query != self._getSearchQuery():
+            return
+        if playList.generation != self.playListPage.playListModel.getGeneration():
+            # the play list changed while searching, the rows belong to an older one
+            self.updatePlayListView()
+            return
+        self.playListPage.playListModel.setRowMap(rows)
+        
+    def preloadMediaInfo(self, mediaInfo: MediaInfo):
+        """Prepares what `updateMediaInfo` shows for the upcoming song, so switching to it doesn't wait for the disk"""
+        if mediaInfo.cover:
+            self.thumbnailLoader.prefetch(mediaInfo.cover, [self.playStateBar.coverThumbnailSpec, 
+                                                            self.musicDetailPage.coverThumbnailSpec])
+        self.musicDetailPage.preloadLyrics(mediaInfo)
+        
     def updateMediaInfo(self, mediaInfo: MediaInfo):
+        if mediaInfo.cover:
+            # both sizes from a single decode
+            self.thumbnailLoader.prefetch(mediaInfo.cover, [self.playStateBar.coverThumbnailSpec, 
+                                                            self.musicDetailPage.coverThumbnailSpec])
         self.playStateBar.setMediaInfo(mediaInfo)
         self.musicDetailPage.setMediaInfo(mediaInfo)
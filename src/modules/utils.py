@@ -1,28 +1,52 @@
-from typing import Union, Literal
+from typing import Union, Literal, BinaryIO, Callable
 from pathlib import Path
+from collections import OrderedDict
+from operator import attrgetter
+from threading import Lock
 import re
 
 from PySide6.QtGui import QPainter, QPainterPath
 from PySide6.QtCore import QRectF, Qt, QPoint, QSize
-from PySide6.QtGui import QPixmap
-from mutagen import flac, id3, mp3
-from filetype import guess_mime as checkFileType
+from PySide6.QtGui import QPixmap, QImage
+from mutagen import MutagenError, flac, id3, mp3
 
-from .types_ import MediaInfo, MediaItem, LrcObject
+from .types_ import MediaInfo, MediaItem, LrcObject, LrcWord, CoverRef, LyricsRef
+from .cache import CoverCache
+from .tags import findFlacPicture, findId3Picture, getId3v2End
+from .searchkeys import getSearchKeys
 
-def createRoundedPixmap(pixmap: QPixmap, radius: Union[int, float], targetSize: QSize | None = None) -> QPixmap:
+# results of createRoundedPixmap, keyed by (source, radius, target size)
+_roundedPixmapCache: OrderedDict[tuple, QPixmap] = OrderedDict()
+_ROUNDED_PIXMAP_CACHE_SIZE = 32
+
+def createRoundedPixmap(source: QPixmap | str | Path, 
+                        radius: Union[int, float], 
+                        targetSize: QSize | None = None) -> QPixmap:
+    """
+    Rounds the corners of `source`, scaled to fit `targetSize` if given.
+    `radius` is in pixels of the source, so the result looks the same at any size.
+    Sources given as a path are only loaded when the result isn't cached.
+    """
+    sourceKey = source.cacheKey() if isinstance(source, QPixmap) else str(source)
+    key = (sourceKey, radius, (targetSize.width(), targetSize.height()) if targetSize else None)
+    cached = _roundedPixmapCache.get(key)
+    if cached is not None:
+        _roundedPixmapCache.move_to_end(key)
+        return cached
+    
+    pixmap = source if isinstance(source, QPixmap) else QPixmap(str(source))
     if pixmap.isNull():
         return pixmap
 
-    imageWidth = pixmap.width()
-    imageHeight = pixmap.height()
+    # scale first, so only the pixels that are shown get clipped
+    if targetSize:
+        scaled = pixmap.scaled(targetSize, 
+                               Qt.AspectRatioMode.KeepAspectRatio, 
+                               Qt.TransformationMode.SmoothTransformation)
+        radius = radius * scaled.width() / pixmap.width()
+        pixmap = scaled
 
-    newPixmap = QPixmap(
-        pixmap.scaled(imageWidth, 
-                      imageWidth if imageHeight == 0 else imageHeight, 
-                      Qt.AspectRatioMode.IgnoreAspectRatio,
-                      Qt.TransformationMode.SmoothTransformation))
-    destImage = QPixmap(imageWidth, imageHeight)
+    destImage = QPixmap(pixmap.size())
     destImage.fill(Qt.GlobalColor.transparent)
 
     painter = QPainter(destImage)
@@ -30,16 +54,34 @@ def createRoundedPixmap(pixmap: QPixmap, radius: Union[int, float], targetSize:
                           QPainter.RenderHint.SmoothPixmapTransform)
 
     path = QPainterPath()
-    rect = QRectF(0, 0, imageWidth, imageHeight)
-    path.addRoundedRect(rect, radius, radius)
+    path.addRoundedRect(QRectF(0, 0, pixmap.width(), pixmap.height()), radius, radius)
     painter.setClipPath(path)
-    painter.drawPixmap(0, 0, imageWidth, imageHeight, newPixmap)
+    painter.drawPixmap(0, 0, pixmap)
     painter.end()
     
-    if targetSize:
-        destImage = destImage.scaled(targetSize, 
-                                     Qt.AspectRatioMode.KeepAspectRatio, 
-                                     Qt.TransformationMode.SmoothTransformation)
+    _roundedPixmapCache[key] = destImage
+    if len(_roundedPixmapCache) > _ROUNDED_PIXMAP_CACHE_SIZE:
+        _roundedPixmapCache.popitem(last=False)
+
+    return destImage
+
+def createRoundedImage(image: QImage, radius: Union[int, float]) -> QImage:
+    """Rounds the corners of `image` as it is, unlike QPixmap a QImage can be painted outside the UI thread"""
+    if image.isNull() or radius <= 0:
+        return image
+
+    destImage = QImage(image.size(), QImage.Format.Format_ARGB32_Premultiplied)
+    destImage.fill(Qt.GlobalColor.transparent)
+
+    painter = QPainter(destImage)
+    painter.setRenderHint(QPainter.RenderHint.Antialiasing | 
+                          QPainter.RenderHint.SmoothPixmapTransform)
+
+    path = QPainterPath()
+    path.addRoundedRect(QRectF(0, 0, image.width(), image.height()), radius, radius)
+    painter.setClipPath(path)
+    painter.drawImage(0, 0, image)
+    painter.end()
 
     return destImage
 
@@ -77,77 +119,220 @@ def humanizeDuration(milliseconds: int) -> str:
     else:
         return f"{minutes}:{seconds:02d}"
 
-def parseLrc(lrcContent: str):
-    pattern = r'\[(\d+):(\d+)\.(\d+)\]'
-    lines = lrcContent.strip().split('\n')
+# [mm:ss], [mm:ss.xx] or [mm:ss.xxx], some editors write [mm:ss:xx]
+_LRC_TIME_TAG = re.compile(r"\[(\d+):(\d+)(?:[.:](\d+))?\]")
+_LRC_WORD_TAG = re.compile(r"<(\d+):(\d+)(?:[.:](\d+))?>")
+_LRC_OFFSET_TAG = re.compile(r"\[offset:\s*([+-]?\d+)\s*\]", re.IGNORECASE)
+
+# parsed lyrics, keyed by (source, mtime), the lists are shared and must not be modified
+_lrcCache: OrderedDict[tuple[str, int], list[LrcObject]] = OrderedDict()
+# lyrics are also preloaded in a background thread
+_lrcCacheLock = Lock()
+_LRC_CACHE_SIZE = 32
+
+def _getTagMs(minutes: str, seconds: str, fraction: str | None) -> int:
+    # the fraction is hundredths in most files, but may have any number of digits
+    fractionMs = round(int(fraction) * 10 ** (3 - len(fraction))) if fraction else 0
+    return int(minutes) * 60000 + int(seconds) * 1000 + fractionMs
+
+def parseLrc(lrcContent: str) -> list[LrcObject]:
+    """
+    Parses the lines of an LRC file, sorted by time. A line with several time
+    tags is repeated at each of them. `[offset:]` shifts every line, a positive
+    offset shows the lyrics earlier. Word tags of enhanced LRC (`<mm:ss.xx>`)
+    are split into `LrcObject.words`.
+    """
     lrcList: list[LrcObject] = []
-    for line in lines:
-        matches = re.findall(pattern, line)
-        if matches:
-            timeTags = matches
-            lyric = re.sub(pattern, '', line).strip()
-            for min, sec, ms in timeTags:
-                totalMs = int(min) * 60000 + int(sec) * 1000 + int(ms)
-                lrcList.append(LrcObject(totalMs, lyric))
-    lrcList.sort(key=lambda x: x.timeMs)
+    offsetMs = 0
+    # a byte order mark isn't whitespace, it would hide the time tags of the first line
+    for line in lrcContent.removeprefix("\ufeff").splitlines():
+        line = line.strip()
+        position = 0
+        timesMs: list[int] = []
+        while match := _LRC_TIME_TAG.match(line, position):
+            timesMs.append(_getTagMs(*match.groups()))
+            position = match.end()
+        
+        if not timesMs:
+            offsetMatch = _LRC_OFFSET_TAG.match(line)
+            if offsetMatch:
+                offsetMs = int(offsetMatch.group(1))
+            continue
+        
+        text = line[position:]
+        words: list[LrcWord] = []
+        if "<" in text:
+            # [time, text, time, text, ...] after whatever comes before the first tag
+            parts = _LRC_WORD_TAG.split(text)
+            if len(parts) > 1:
+                for i in range(1, len(parts), 4):
+                    words.append(LrcWord(_getTagMs(*parts[i:i + 3]), parts[i + 3]))
+                text = parts[0] + "".join(word.text for word in words)
+        text = text.strip()
+        for timeMs in timesMs:
+            lrcList.append(LrcObject(timeMs, text, words))
+    
+    if offsetMs:
+        for lrc in lrcList:
+            lrc.timeMs = max(0, lrc.timeMs - offsetMs)
+            # the repeats of a line share its words, they're replaced rather than shifted in place
+            lrc.words = [LrcWord(max(0, word.timeMs - offsetMs), word.text) for word in lrc.words]
+    lrcList.sort(key=attrgetter("timeMs"))
     return lrcList
 
-def getMediaItemFromPath(mediaPath: Path, lyricsDir: Path, coversDir: Path) -> MediaItem:
-    fileMimeType = checkFileType(str(mediaPath))
+def _parseLyricsText(text: str) -> list[LrcObject]:
+    lrcList = parseLrc(text)
+    if lrcList:
+        return lrcList
+    # plain lyrics, every line at 0
+    return [LrcObject(0, line.strip()) for line in text.strip().splitlines()]
+
+def _readEmbeddedLyrics(lyricsRef: LyricsRef) -> list[LrcObject]:
+    """Empty when the tag is gone, the file may have been retagged since it was scanned"""
+    if lyricsRef.tag in ("SYLT", "USLT"):
+        # only the tag is read, not the audio
+        frames = id3.ID3(lyricsRef.sourcePath).getall(lyricsRef.tag)
+        if lyricsRef.tag == "USLT":
+            return _parseLyricsText(frames[0].text) if frames else []
+        frame = next((frame for frame in frames if frame.format == 2), None)
+        if frame is None:
+            return []
+        return sorted((LrcObject(timeMs, text.strip()) for text, timeMs in frame.text), key=attrgetter("timeMs"))
+    audio = flac.FLAC(lyricsRef.sourcePath)
+    if not audio.get(lyricsRef.tag):
+        return []
+    return _parseLyricsText("\n".join(audio[lyricsRef.tag]))
+
+def getEmbeddedLyricsTag(audio: flac.FLAC | mp3.MP3) -> str | None:
+    """The tag `loadLyrics` reads the lyrics of `audio` from, synced ones are preferred"""
+    if isinstance(audio, flac.FLAC):
+        for tag in ("LYRICS", "UNSYNCEDLYRICS"):
+            if audio.get(tag):
+                return tag
+        return None
+    if audio.tags is None:
+        return None
+    # timestamps in MPEG frames would need the frame rate, they're left out
+    if any(frame.format == 2 for frame in audio.tags.getall("SYLT")):
+        return "SYLT"
+    if audio.tags.getall("USLT"):
+        return "USLT"
+    return None
+
+def loadLyrics(source: Path | LyricsRef) -> list[LrcObject]:
+    """
+    Lyrics of an LRC file or embedded in a track, lines without timestamps are at 0.
+    They're only read and parsed again once the file was modified. A source that
+    can't be read, e.g. moved since the scan or with a broken tag, has no lyrics.
+    """
+    sourcePath = source.sourcePath if isinstance(source, LyricsRef) else source
+    try:
+        mtimeNs = sourcePath.stat().st_mtime_ns
+    except OSError:
+        return []
+    key = (f"{sourcePath}#{source.tag}" if isinstance(source, LyricsRef) else str(sourcePath), mtimeNs)
+    with _lrcCacheLock:
+        lrcList = _lrcCache.get(key)
+        if lrcList is not None:
+            _lrcCache.move_to_end(key)
+            return lrcList
+    try:
+        if isinstance(source, LyricsRef):
+            lrcList = _readEmbeddedLyrics(source)
+        else:
+            with open(source, "r", encoding="utf-8-sig") as file:
+                lrcList = parseLrc(file.read())
+    except (OSError, UnicodeDecodeError, MutagenError):
+        return []
+    with _lrcCacheLock:
+        _lrcCache[key] = lrcList
+        if len(_lrcCache) > _LRC_CACHE_SIZE:
+            _lrcCache.popitem(last=False)
+    return lrcList
+
+def storeCover(coverCache: CoverCache, data: bytes, mimeType: str) -> CoverRef:
+    return CoverRef(coverCache.store(data, mimeType), 0, len(data), mimeType)
+
+def readCoverBytes(cover: CoverRef) -> bytes:
+    with open(cover.sourcePath, "rb") as file:
+        file.seek(cover.offset)
+        return file.read(cover.length)
+
+def _readFlac(file: BinaryIO, mediaPath: Path, coverCache: CoverCache) -> MediaItem:
+    audio = flac.FLAC(file)
     
-    if fileMimeType == "audio/x-flac":
-        file = flac.FLAC(mediaPath)
-        
-        title: str = file.get("title", [mediaPath.name])[0] # pyright: ignore[reportOptionalSubscript]
-        
-        artists: list[str] = file.get("artist", ["未知歌手"]) # pyright: ignore[reportAssignmentType]
-        artist = ""
-        for i in artists:
-            artist += i
-            
-        album: str = file.get("album", ["未知专辑"])[0] # pyright: ignore[reportOptionalSubscript]
-        
-        lengthMs: int = round(file.info.length * 1000)
-        
-        try:
-            coverData: bytes = file.pictures[0].data
-            coverFilePath = Path(coversDir / mediaPath.stem)
-            coverFile = open(coverFilePath, "wb")
-            coverFile.write(coverData)
-            coverFile.close()
-        except Exception as e:
-            coverFilePath = None
-            
-        lyricsFilePath = Path(lyricsDir / mediaPath.stem).with_suffix(".lrc")
-        if not lyricsFilePath.exists():
-            lyricsFilePath = None
-        
-        info = MediaInfo(title, artist, album, lengthMs, coverFilePath, lyricsFilePath)
-        return MediaItem(mediaPath, info)
+    title: str = audio.get("title", [mediaPath.name])[0] # pyright: ignore[reportOptionalSubscript]
     
-    elif fileMimeType == "audio/mpeg":
-        file = mp3.MP3(mediaPath, ID3=id3.ID3)
+    artists: list[str] = audio.get("artist", ["未知歌手"]) # pyright: ignore[reportAssignmentType]
+    artist = ""
+    for i in artists:
+        artist += i
         
-        title = str(file.get('TIT2', mediaPath.name))
-        artist = str(file.get('TPE1', "未知歌手"))
-        album = str(file.get('TALB', "未知专辑"))
-        lengthMs = round(file.info.length * 1000)
-        
-        try:
-            coverData: bytes = file.tags.getall("APIC")[0].data  # pyright: ignore[reportOptionalMemberAccess]
-            coverFilePath = Path(coversDir / (mediaPath.name + ".jpg"))
-            coverFile = open(coverFilePath, "wb")
-            coverFile.write(coverData)
-            coverFile.close()
-        except Exception as e:
-            coverFilePath = None
-            
-        lyricsFilePath = Path(lyricsDir / mediaPath.stem).with_suffix(".lrc")
-        if not lyricsFilePath.exists():
-            lyricsFilePath = None
-            
-        info = MediaInfo(title, artist, album, lengthMs, coverFilePath, lyricsFilePath)
-        return MediaItem(mediaPath, info)
+    album: str = audio.get("album", ["未知专辑"])[0] # pyright: ignore[reportOptionalSubscript]
+    
+    lengthMs: int = round(audio.info.length * 1000)
+    
+    cover = findFlacPicture(file, mediaPath)
+    if cover is None and audio.pictures:
+        # can't be served from the file directly, keep a copy in the cache
+        cover = storeCover(coverCache, audio.pictures[0].data, audio.pictures[0].mime)
+    
+    # lyrics files are resolved by the caller, see `LyricsIndex`
+    info = MediaInfo(title, artist, album, lengthMs, cover, None)
+    lyricsTag = getEmbeddedLyricsTag(audio)
+    if lyricsTag:
+        info.embeddedLyrics = LyricsRef(mediaPath, lyricsTag)
+    return MediaItem(mediaPath, info)
+
+def _readMp3(file: BinaryIO, mediaPath: Path, coverCache: CoverCache) -> MediaItem:
+    audio = mp3.MP3(file, ID3=id3.ID3)
+    
+    title = str(audio.get('TIT2', mediaPath.name))
+    artist = str(audio.get('TPE1', "未知歌手"))
+    album = str(audio.get('TALB', "未知专辑"))
+    lengthMs = round(audio.info.length * 1000)
+    
+    cover = findId3Picture(file, mediaPath)
+    pictures = audio.tags.getall("APIC") if audio.tags else []
+    if cover is None and pictures:
+        # can't be served from the file directly, keep a copy in the cache
+        cover = storeCover(coverCache, pictures[0].data, pictures[0].mime)
         
-    else:
-        raise TypeError(f"Unsupported file type: {fileMimeType}")
+    # lyrics files are resolved by the caller, see `LyricsIndex`
+    info = MediaInfo(title, artist, album, lengthMs, cover, None)
+    lyricsTag = getEmbeddedLyricsTag(audio)
+    if lyricsTag:
+        info.embeddedLyrics = LyricsRef(mediaPath, lyricsTag)
+    return MediaItem(mediaPath, info)
+
+# readers keyed by the magic bytes at the start of the file
+_MAGIC_READERS: dict[bytes, Callable[[BinaryIO, Path, CoverCache], MediaItem]] = {
+    b"fLaC": _readFlac,
+    b"ID3": _readMp3,
+}
+
+def _sniffReader(file: BinaryIO) -> Callable[[BinaryIO, Path, CoverCache], MediaItem] | None:
+    header = file.read(4)
+    reader = _MAGIC_READERS.get(header) or _MAGIC_READERS.get(header[:3])
+    if reader is _readMp3:
+        # FLAC files may also start with an ID3v2 tag
+        file.seek(getId3v2End(file))
+        if file.read(4) == b"fLaC":
+            reader = _readFlac
+    elif reader is None and len(header) >= 2 and header[0] == 0xFF and header[1] & 0xE0 == 0xE0:
+        # MPEG frame sync, an MP3 without ID3v2 tag
+        reader = _readMp3
+    file.seek(0)
+    return reader
+
+def getMediaItemFromPath(mediaPath: Path, coverCache: CoverCache) -> MediaItem:
+    # the file is only opened once, sniffing and every parser share the handle
+    with open(mediaPath, "rb") as file:
+        reader = _sniffReader(file)
+        if reader is None:
+            raise TypeError(f"Unsupported file type: {mediaPath.suffix}")
+        mediaItem = reader(file, mediaPath, coverCache)
+    info = mediaItem.mediaInfo
+    # in the scan worker, so the UI never converts tags while searching
+    info.searchKeys = getSearchKeys(info.title, info.artist, info.album)
+    return mediaItem
@@ -0,0 +1,58 @@
+from time import perf_counter
+from typing import Iterable
+
+from PySide6.QtCore import QObject, QFileSystemWatcher, QTimer, Signal
+
+class DirectoryWatcher(QObject):
+    """
+    Watches a set of directories and reports the ones that changed.
+
+    Bursts of events, e.g. copying a whole album, are coalesced: `directoriesChanged`
+    is emitted once no event came for `debounceMs`, but at the latest `maxDelayMs`
+    after the first event of the burst. Only files added, removed or renamed in a
+    watched directory are reported, writes to an existing file may not be.
+    """
+    directoriesChanged = Signal(list)
+
+    def __init__(self, debounceMs: int = 1000, maxDelayMs: int = 5000, parent: QObject | None = None):
+        super().__init__(parent)
+        self._maxDelayS = maxDelayMs / 1000
+        self._dirtyDirs: set[str] = set()
+        self._burstStartTime = 0.0
+
+        self._watcher = QFileSystemWatcher(self)
+        self._watcher.directoryChanged.connect(self._onDirectoryChanged)
+        self._debounceTimer = QTimer(self)
+        self._debounceTimer.setSingleShot(True)
+        self._debounceTimer.setInterval(debounceMs)
+        self._debounceTimer.timeout.connect(self._flush)
+
+    def addDirectories(self, directories: Iterable[str]):
+        watched = set(self._watcher.directories())
+        newDirs = [directory for directory in directories if directory not in watched]
+        if newDirs:
+            self._watcher.addPaths(newDirs)
+
+    def getDirectories(self) -> list[str]:
+        return self._watcher.directories()
+
+    def clear(self):
+        directories = self._watcher.directories()
+        if directories:
+            self._watcher.removePaths(directories)
+        self._dirtyDirs.clear()
+        self._debounceTimer.stop()
+
+    def _onDirectoryChanged(self, directory: str):
+        if not self._dirtyDirs:
+            self._burstStartTime = perf_counter()
+        self._dirtyDirs.add(directory)
+        # restart the timer unless the burst is already too long
+        if not self._debounceTimer.isActive() or perf_counter() - self._burstStartTime < self._maxDelayS:
+            self._debounceTimer.start()
+
+    def _flush(self):
+        dirtyDirs = sorted(self._dirtyDirs)
+        self._dirtyDirs.clear()
+        if dirtyDirs:
+            self.directoriesChanged.emit(dirtyDirs)